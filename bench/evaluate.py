@@ -0,0 +1,133 @@
+import csv
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from pydantic import BaseModel
+
+from game.game import PTBGame
+from game.leaks import LeakDetector
+
+
+class AttackResult(BaseModel):
+    level: int
+    index: int  # Position of the prompt in the corpus
+    leaked: bool = False
+    error: str | None = None
+
+
+class LevelReport(BaseModel):
+    level: int
+    name: str
+    attacks: int = 0
+    leaks: int = 0
+    errors: int = 0
+
+    @property
+    def leak_rate(self) -> float:
+        answered = self.attacks - self.errors
+        return self.leaks / answered if answered else 0.0
+
+
+def load_corpus(path: Path) -> list[str]:
+    """Load attack prompts from a CSV file with a 'prompt' column or from JSONL.
+
+    JSONL lines are either strings or objects with a 'prompt' field.
+    """
+    with path.open(encoding="UTF-8", newline="") as f:
+        if path.suffix.lower() == ".csv":
+            return [row["prompt"] for row in csv.DictReader(f) if row.get("prompt")]
+        prompts = []
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            prompts.append(item if isinstance(item, str) else item["prompt"])
+        return prompts
+
+
+def run_evaluation(
+    game: PTBGame,
+    prompts: list[str],
+    checkpoint: Path,
+    concurrency: int = 8,
+    levels: list[int] | None = None,
+) -> list[AttackResult]:
+    """Send every prompt to every level through the game's guards.
+
+    Each attack starts a fresh conversation. Results are appended to the
+    checkpoint file as they come in, and attacks already in it are skipped,
+    so an interrupted run picks up where it stopped.
+    """
+    levels = range(len(game.levels)) if levels is None else levels
+    # Failed attacks are tried again
+    results = {(r.level, r.index): r for r in _read_checkpoint(checkpoint)}
+    todo = [
+        (level, index)
+        for level in levels
+        for index in range(len(prompts))
+        if (level, index) not in results or results[level, index].error
+    ]
+    detectors = {
+        level: LeakDetector(game.get_level_password(level)) for level in levels
+    }
+    lock = threading.Lock()
+
+    def attack(task: tuple[int, int]):
+        level, index = task
+        result = AttackResult(level=level, index=index)
+        try:
+            response = game._query(game.new_state(level), prompts[index])
+            result.leaked = detectors[level].contains_leak(response)
+        except Exception as e:
+            logging.warning(f"Attack {index} on level {level} failed: {e}")
+            result.error = str(e)
+        with lock:
+            results[level, index] = result
+            f.write(result.model_dump_json() + "\n")
+            f.flush()
+
+    with checkpoint.open("a", encoding="UTF-8") as f:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(attack, todo))
+    return list(results.values())
+
+
+def summarize(game: PTBGame, results: list[AttackResult]) -> list[LevelReport]:
+    reports = {}
+    for result in results:
+        report = reports.get(result.level)
+        if report is None:
+            name = game.levels[result.level].name()
+            report = reports[result.level] = LevelReport(level=result.level, name=name)
+        report.attacks += 1
+        report.leaks += result.leaked
+        report.errors += result.error is not None
+    return [reports[level] for level in sorted(reports)]
+
+
+def format_evaluation(reports: list[LevelReport]) -> str:
+    lines = [
+        f"{'Level':<6}{'Name':<12}{'Attacks':>8}{'Leaks':>8}{'Errors':>8}  Leak rate"
+    ]
+    for r in reports:
+        lines.append(
+            f"{r.level:<6}{r.name:<12}{r.attacks:>8}{r.leaks:>8}{r.errors:>8}"
+            f"  {r.leak_rate:.1%}"
+        )
+    return "\n".join(lines)
+
+
+def _read_checkpoint(checkpoint: Path) -> list[AttackResult]:
+    if not checkpoint.exists():
+        return []
+    results = []
+    for line in checkpoint.read_text(encoding="UTF-8").splitlines():
+        try:
+            results.append(AttackResult.model_validate_json(line))
+        except ValueError:
+            # The last line may be cut off when a run is killed mid write
+            continue
+    return results
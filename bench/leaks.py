@@ -0,0 +1,45 @@
+import random
+import time
+
+from bench.harness import _percentile
+from bench.mock_server import WORDS
+from game.leaks import LeakDetector
+
+
+def run_leak_bench(
+    password: str, tokens: int = 2000, runs: int = 200
+) -> dict[str, list[float]]:
+    """Time the leak detector on clean responses, the worst case as no check stops early.
+
+    Returns the latencies of checking a complete response and of streaming it
+    through a scanner one token at a time.
+    """
+    detector = LeakDetector(password)
+    words = [random.choice(WORDS) for _ in range(tokens)]
+    lines = [" ".join(words[i : i + 12]) for i in range(0, tokens, 12)]
+    response = "\n".join(lines)
+    chunks = [" " + word for word in words]
+
+    result = {"Full check": [], "Streamed": []}
+    for _ in range(runs):
+        start = time.perf_counter()
+        detector.contains_leak(response)
+        result["Full check"].append(time.perf_counter() - start)
+
+        scanner = detector.scanner()
+        start = time.perf_counter()
+        for chunk in chunks:
+            scanner.feed(chunk)
+        scanner.flush()
+        result["Streamed"].append(time.perf_counter() - start)
+    return result
+
+
+def format_leak_report(result: dict[str, list[float]]) -> str:
+    return "\n".join(
+        f"{name + ':':<13}"
+        + "  ".join(
+            f"p{p} {_percentile(latencies, p) * 1000:.3f}ms" for p in (50, 95, 99)
+        )
+        for name, latencies in result.items()
+    )
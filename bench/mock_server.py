@@ -0,0 +1,166 @@
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pydantic import BaseModel
+
+WORDS = "the ancient machine hums quietly while guarding its secret".split()
+PASSWORD_PATTERN = re.compile(r"The password is: (\S+)")
+
+
+class MockServerConfig(BaseModel):
+    host: str = "127.0.0.1"
+    port: int = 11434
+    model: str = "llama3.1:8b"
+    first_token_latency: float = 0.2  # Seconds before the first token
+    tokens_per_second: float = 50.0
+    response_tokens: int = 40
+    leak_rate: float = 0.0  # Share of responses that reveal the password
+
+
+class MockModelServer(ThreadingHTTPServer):
+    """Imitates the Ollama, OpenAI and Anthropic HTTP APIs with configurable timing.
+
+    Responses are filler text generated at a fixed token rate, optionally
+    containing the password found in the prompt, so the game can be driven
+    end to end without a GPU.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, config: MockServerConfig):
+        self.config = config
+        super().__init__((config.host, config.port), _MockHandler)
+
+    def handle_error(self, request, client_address):
+        # Clients dropping their keep-alive connections is expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def start(self) -> threading.Thread:
+        """Serve in a background thread and return it."""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def generate_tokens(self, prompt: str):
+        """Yield response tokens, sleeping to match the configured latency and rate."""
+        time.sleep(self.config.first_token_latency)
+        tokens = [
+            " " + random.choice(WORDS) for _ in range(self.config.response_tokens)
+        ]
+        password = PASSWORD_PATTERN.search(prompt)
+        if password and random.random() < self.config.leak_rate:
+            tokens.insert(random.randrange(len(tokens) + 1), " " + password.group(1))
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(1 / self.config.tokens_per_second)
+            yield token
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: MockModelServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.endswith("/tags"):
+            self._send_json({"models": [{"name": self.server.config.model}]})
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        prompt = "\n".join(
+            [request.get("system", ""), request.get("prompt", "")]
+            + [m["content"] for m in request.get("messages", [])]
+        )
+        tokens = self.server.generate_tokens(prompt)
+
+        try:
+            if self.path.endswith("/generate") or self.path.endswith("/chat"):
+                self._ollama(request, tokens)
+            elif self.path.endswith("/chat/completions"):
+                self._openai(request, tokens)
+            elif self.path.endswith("/messages"):
+                self._anthropic(request, tokens)
+            else:
+                self.send_error(404)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading, like a real server we stop generating
+            self.close_connection = True
+
+    def _ollama(self, request: dict, tokens):
+        def part(text: str, done: bool) -> dict:
+            if self.path.endswith("/chat"):
+                return {"message": {"role": "assistant", "content": text}, "done": done}
+            return {"response": text, "done": done}
+
+        if request.get("stream", True) is False:
+            self._send_json(part("".join(tokens), True))
+            return
+        self._start_stream("application/x-ndjson")
+        for token in tokens:
+            self._write_chunk(json.dumps(part(token, False)) + "\n")
+        self._write_chunk(json.dumps(part("", True)) + "\n")
+        self._end_stream()
+
+    def _openai(self, request: dict, tokens):
+        if not request.get("stream"):
+            message = {"role": "assistant", "content": "".join(tokens)}
+            self._send_json({"choices": [{"message": message}]})
+            return
+        self._start_stream("text/event-stream")
+        for token in tokens:
+            event = {"choices": [{"delta": {"content": token}}]}
+            self._write_chunk(f"data: {json.dumps(event)}\n\n")
+        self._write_chunk("data: [DONE]\n\n")
+        self._end_stream()
+
+    def _anthropic(self, request: dict, tokens):
+        if not request.get("stream"):
+            self._send_json({"content": [{"type": "text", "text": "".join(tokens)}]})
+            return
+        self._start_stream("text/event-stream")
+        for token in tokens:
+            event = {
+                "type": "content_block_delta",
+                "delta": {"type": "text_delta", "text": token},
+            }
+            self._write_chunk(
+                f"event: content_block_delta\ndata: {json.dumps(event)}\n\n"
+            )
+        self._write_chunk(
+            f"event: message_stop\ndata: {json.dumps({'type': 'message_stop'})}\n\n"
+        )
+        self._end_stream()
+
+    def _send_json(self, data: dict):
+        body = json.dumps(data).encode("UTF-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_stream(self, content_type: str):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _write_chunk(self, text: str):
+        data = text.encode("UTF-8")
+        self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
@@ -1,12 +1,21 @@
+import contextlib
+import importlib.util
 import logging
 import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
 
 import click
 
 from frontend.app import create_app
+from game.metrics import content_log_filter
 
 logging.basicConfig(level=logging.INFO)
 
+DEFAULT_SHARED_SESSION_STORE = "sqlite:///sessions.db"
+
 
 @click.group()
 def cli():
@@ -24,16 +33,235 @@ def cli():
     type=click.Choice(["ollama", "chatgpt", "claude"], case_sensitive=False),
     help="Select the model to use (ollama, chatgpt, claude).",
 )
-def runserver(host, port, debug, model_type):
+@click.option(
+    "--session-store",
+    default=None,
+    help="Player session store, 'memory' or 'sqlite:///<path>'. Several workers share sqlite:///sessions.db by default.",
+    type=str,
+)
+@click.option(
+    "--worker-class",
+    default="gthread",
+    type=click.Choice(["sync", "gthread", "gevent"], case_sensitive=False),
+    help="Gunicorn worker type, gevent needs the optional gevent package.",
+)
+@click.option("--workers", default=2, help="Number of worker processes.", type=int)
+@click.option(
+    "--threads", default=64, help="Threads per gthread worker.", type=int
+)
+@click.option(
+    "--connections",
+    default=1000,
+    help="Concurrent connections per gevent worker.",
+    type=int,
+)
+@click.option(
+    "--timeout",
+    default=120,
+    help="Seconds before a silent worker is restarted.",
+    type=int,
+)
+def runserver(
+    host,
+    port,
+    debug,
+    model_type,
+    session_store,
+    worker_class,
+    workers,
+    threads,
+    connections,
+    timeout,
+):
 
     """Run the Flask web application."""
+    shared = workers > 1 and not debug
+    if session_store is None:
+        session_store = DEFAULT_SHARED_SESSION_STORE if shared else "memory"
+    elif session_store == "memory" and shared:
+        # Every worker would keep its own copy of a player's level and conversation
+        raise click.UsageError(
+            "The memory session store can't be shared between workers, "
+            "use --workers 1 or --session-store sqlite:///<path>."
+        )
     os.environ["GTP_MODEL_TYPE"] = model_type  #FIXME: Set so "create_app" can be called with gunicorn
+    os.environ["GTP_SESSION_STORE"] = session_store
     if debug:
+        # Log every prompt and response while developing
+        content_log_filter.rate = 1.0
         app = create_app()
         app.run(debug=debug, host=host, port=port)
     else:
-        command = f"gunicorn -w 4 -b {host}:{port} 'frontend.app:create_app()'"
-        os.system(command)
+        # A new directory per run, so every /metrics scrape sums all workers
+        os.environ.setdefault(
+            "GTP_METRICS_DIR", tempfile.mkdtemp(prefix="gtp-metrics-")
+        )
+        command = [
+            "gunicorn",
+            "--workers",
+            str(workers),
+            "--worker-class",
+            worker_class,
+            "--timeout",
+            str(timeout),
+            "--bind",
+            f"{host}:{port}",
+            "--config",
+            "python:frontend.gunicorn_config",
+        ]
+        if worker_class == "gthread":
+            command += ["--threads", str(threads)]
+        elif worker_class == "gevent":
+            if importlib.util.find_spec("gevent") is None:
+                raise click.UsageError(
+                    "The gevent worker needs gevent, install it with "
+                    "'poetry install --with async'."
+                )
+            # Greenlets are cheap, every connection gets one
+            command += ["--worker-connections", str(connections)]
+        command.append("frontend.app:create_app()")
+        sys.exit(subprocess.run(command).returncode)
+
+
+@cli.command()
+@click.option("--players", default=10, help="Number of simulated players.", type=int)
+@click.option("--queries", default=5, help="Queries sent by every player.", type=int)
+@click.option("--level", default=0, help="Level the players play.", type=int)
+@click.option("--stream/--no-stream", default=True, help="Use the streaming route.")
+@click.option(
+    "--model-type",
+    default="ollama",
+    type=click.Choice(["ollama", "chatgpt", "claude"], case_sensitive=False),
+    help="Backend API the mock model server is called through.",
+)
+@click.option(
+    "--first-token-latency", default=0.2, help="Mock seconds to first token.", type=float
+)
+@click.option("--token-rate", default=50.0, help="Mock tokens per second.", type=float)
+@click.option(
+    "--response-tokens", default=40, help="Mock tokens per response.", type=int
+)
+@click.option(
+    "--url",
+    default=None,
+    help="Benchmark an already running server instead of starting one with a mock model.",
+    type=str,
+)
+def bench(
+    players,
+    queries,
+    level,
+    stream,
+    model_type,
+    first_token_latency,
+    token_rate,
+    response_tokens,
+    url,
+):
+    """Benchmark the web application with simulated players."""
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    from bench.harness import (BenchConfig, format_report, run_bench,
+                               run_local_bench)
+    from bench.mock_server import MockServerConfig
+
+    config = BenchConfig(
+        players=players, queries_per_player=queries, level=level, stream=stream
+    )
+    if url:
+        result = run_bench(url.rstrip("/"), config)
+    else:
+        mock_config = MockServerConfig(
+            first_token_latency=first_token_latency,
+            tokens_per_second=token_rate,
+            response_tokens=response_tokens,
+        )
+        result = run_local_bench(config, mock_config, model_type=model_type)
+    click.echo(format_report(result))
+
+
+@cli.command()
+@click.argument("corpus", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option(
+    "--checkpoint",
+    default="evaluation.jsonl",
+    help="File results are appended to, an interrupted run resumes from it.",
+    type=click.Path(dir_okay=False, path_type=Path),
+)
+@click.option("--level", "levels", multiple=True, help="Only attack these levels.", type=int)
+@click.option(
+    "--concurrency", default=4, help="Attacks running at once per backend.", type=int
+)
+@click.option(
+    "--model-type",
+    default="ollama",
+    type=click.Choice(["ollama", "chatgpt", "claude"], case_sensitive=False),
+    help="Select the model to use (ollama, chatgpt, claude).",
+)
+@click.option("--mock", is_flag=True, help="Attack a local mock model server.")
+@click.option(
+    "--leak-rate", default=0.5, help="Share of mock responses that leak.", type=float
+)
+def evaluate(corpus, checkpoint, levels, concurrency, model_type, mock, leak_rate):
+    """Run a corpus of attack prompts (CSV or JSONL) against every level."""
+    logging.getLogger().setLevel(logging.WARNING)
+    from bench.evaluate import (format_evaluation, load_corpus, run_evaluation,
+                                summarize)
+    from bench.harness import mock_game
+    from bench.mock_server import MockServerConfig
+    from game.game import load_game
+
+    prompts = load_corpus(corpus)
+    with contextlib.ExitStack() as stack:
+        if mock:
+            mock_config = MockServerConfig(
+                first_token_latency=0.01, tokens_per_second=2000, leak_rate=leak_rate
+            )
+            game = stack.enter_context(mock_game(mock_config, model_type))
+        else:
+            game = load_game(model_type=model_type)
+        # The evaluation bounds its own concurrency, it isn't one player to share with
+        game.scheduler = None
+        backends = game.model.get_info().get("backends", 1)
+        results = run_evaluation(
+            game, prompts, checkpoint, concurrency * backends, list(levels) or None
+        )
+    click.echo(format_evaluation(summarize(game, results)))
+
+
+@cli.command("bench-leaks")
+@click.option("--password", default="MIXTUREOFSECRETS", help="Password to detect.")
+@click.option("--tokens", default=2000, help="Tokens per response.", type=int)
+@click.option("--runs", default=200, help="Number of timed responses.", type=int)
+def bench_leaks(password, tokens, runs):
+    """Benchmark the fuzzy password leak detector on long responses."""
+    from bench.leaks import format_leak_report, run_leak_bench
+
+    click.echo(format_leak_report(run_leak_bench(password, tokens, runs)))
+
+
+@cli.command("mock-server")
+@click.option("--host", default="127.0.0.1", help="Host address to bind to.", type=str)
+@click.option("--port", default=11434, help="Port to bind to.", type=int)
+@click.option(
+    "--first-token-latency", default=0.2, help="Seconds to first token.", type=float
+)
+@click.option("--token-rate", default=50.0, help="Tokens per second.", type=float)
+@click.option("--response-tokens", default=40, help="Tokens per response.", type=int)
+def mock_server(host, port, first_token_latency, token_rate, response_tokens):
+    """Run a mock Ollama, OpenAI and Anthropic model server for benchmarks."""
+    from bench.mock_server import MockModelServer, MockServerConfig
+
+    config = MockServerConfig(
+        host=host,
+        port=port,
+        first_token_latency=first_token_latency,
+        tokens_per_second=token_rate,
+        response_tokens=response_tokens,
+    )
+    click.echo(f"Mock model server listening on {host}:{port}")
+    MockModelServer(config).serve_forever()
+
 
 if __name__ == "__main__":
     cli()
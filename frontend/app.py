@@ -1,15 +1,38 @@
+import hashlib
+import json
+import math
 import os
 import logging
+import uuid
+from functools import lru_cache
+from itertools import chain
 
-from flask import (Blueprint, Flask, jsonify, redirect, render_template,
-                   request, session, url_for)
+from flask import (Blueprint, Flask, Response, current_app, jsonify, redirect,
+                   render_template, request, session, stream_with_context,
+                   url_for)
 
-from game.game import CONVERSATION_HISTORY_LENGTH, PTBGame, load_game
+from game.client import ModelError
+from game.game import PTBGame, PTBGameState, load_game
+from game.metrics import RATE_LIMITED, REGISTRY
+from game.scheduler import ModelBusyError
+from game.storage import KeyValueStore, create_store
+
+SESSION_TTL = 60 * 60 * 24
+SESSION_MAX_COUNT = 10000
+MODEL_ERROR_MESSAGE = "My mind went blank for a moment, could you ask me again?"
+PAGE_MAX_AGE = 300
+STATIC_MAX_AGE = 60 * 60 * 24 * 365  # Static URLs change with their content
+# Model settings shown on the index page, anything else may be a secret
+PUBLIC_MODEL_INFO = ("model", "host", "port", "url", "endpoint", "backends")
 
 
 class GameApp:
-    def __init__(self, game: PTBGame):
+    def __init__(self, game: PTBGame, store: KeyValueStore):
         self.game = game
+        self.store = store
+        self._context_levels = None
+        self._page_context = {}
+        self._pages: dict[str, tuple[str, str]] = {}
         self.main = Blueprint("main", __name__)
         self.setup_routes()
 
@@ -26,6 +49,11 @@ class GameApp:
         self.main.add_url_rule(
             "/query/<int:level>", "query", self.query, methods=["POST"]
         )
+        self.main.add_url_rule(
+            "/stream/<int:level>", "stream", self.stream, methods=["POST"]
+        )
+        self.main.add_url_rule("/metrics", "metrics", self.metrics)
+        self.main.add_url_rule("/ready", "ready", self.ready)
         self.main.add_url_rule(
             "/validate_password/<int:level>",
             "validate_password",
@@ -34,31 +62,28 @@ class GameApp:
         )
 
     def index(self):
-        return render_template(
-            "index.html",
-            level_names=self._get_level_names(),
-            level_count=self._get_level_count(),
-            hints=self._get_level_hints(),
-            config=self.game.model.get_info(),
-        )
+        return self._cached_page("index.html")
 
-    def render_game_page(self, level, **kwargs):
-        hint = self.game.get_hint()
-        conversation_history = self.game.get_conversation_history()
+    def render_game_page(self, level, state: PTBGameState, **kwargs):
+        hint = self.game.get_hint(state)
+        conversation_history = self.game.get_conversation_history(state)
+        page_context = self._get_page_context()
         return render_template(
             "game.html",
             level=level,
             hint=hint,
             chat_history=conversation_history,
-            level_names=self._get_level_names(),
-            level_count=self._get_level_count(),
-            context_length=CONVERSATION_HISTORY_LENGTH,
+            level_names=page_context["level_names"],
+            level_count=page_context["level_count"],
+            context_length=self.game.get_context_length(state),
             **kwargs,
         )
 
     def handle_password_query(self, level):
         user_password = request.form.get("user_password")
-        if self.game.level_password_unlock(level, user_password):
+        if self.game.level_password_unlock(
+            level, user_password, self._get_session_id()
+        ):
             session[f"level_{level}_completed"] = True
             return jsonify(success=True, correct_password=True)
         else:
@@ -68,8 +93,18 @@ class GameApp:
         return self.handle_password_query(level)
 
     def handle_game_query(self, level):
+        retry_after = self._check_rate_limit()
+        if retry_after:
+            return self._too_many_requests(retry_after)
         query = request.form.get("query")
-        response = self.game.query_level(query)
+        state = self._load_state(level)
+        try:
+            response = self.game.query_level(state, query, self._get_session_id())
+        except ModelBusyError as e:
+            return self._too_many_requests(e.retry_after)
+        except ModelError as e:
+            return self._model_unavailable(e)
+        self._save_state(state)
         return jsonify(response=response)
 
     def game_page(self, level):
@@ -80,15 +115,50 @@ class GameApp:
             else:
                 return self.handle_game_query(level)
 
-        self.game.load_level(level)
+        state = self._load_state(level)
         logging.info(f"Loading level {level}")
         correct_password = session.get(f"level_{level}_completed", False)
-        return self.render_game_page(level, correct_password=correct_password)
+        return self.render_game_page(
+            level, state, correct_password=correct_password
+        )
 
     def query(self, level):
+        return self.handle_game_query(level)
+
+    def stream(self, level):
+        """Stream the response as server-sent events, ending with a 'done' event."""
+        retry_after = self._check_rate_limit()
+        if retry_after:
+            return self._too_many_requests(retry_after)
         query = request.form.get("query")
-        response = self.game.query_level(query)
-        return jsonify(response=response)
+        state = self._load_state(level)
+        events = self.game.stream_level(state, query, self._get_session_id())
+        try:
+            # Wait for the first event so a full model queue can still get a 429
+            first_event = next(events)
+        except ModelBusyError as e:
+            return self._too_many_requests(e.retry_after)
+        except ModelError as e:
+            return self._model_unavailable(e)
+
+        def generate():
+            try:
+                for event in chain([first_event], events):
+                    if event.response is None:
+                        yield f"data: {json.dumps({'chunk': event.chunk})}\n\n"
+                    else:
+                        self._save_state(state)
+                        yield _done_event(event.response)
+            except ModelError as e:
+                # Headers are sent already, end the stream with the message instead
+                logging.warning(f"Model query failed: {e}")
+                yield _done_event(MODEL_ERROR_MESSAGE)
+
+        return Response(
+            stream_with_context(generate()),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
 
     def next_level(self, level):
         next_level = level + 1
@@ -97,29 +167,167 @@ class GameApp:
         else:
             return redirect(url_for("main.game_page", level=next_level))
 
+    def metrics(self):
+        return Response(
+            REGISTRY.render(), mimetype="text/plain; version=0.0.4; charset=utf-8"
+        )
+
+    def ready(self):
+        """Readiness probe, fails until the model has been warmed up."""
+        if self.game.is_ready():
+            return jsonify(ready=True)
+        return jsonify(ready=False), 503
+
     def win(self):
-        return render_template("win.html")
+        return self._cached_page("win.html")
 
     def reset(self):
         for level in range(len(self.game.levels)):
             session.pop(f"level_{level}_completed", None)
+        self.store.delete(self._get_session_id())
         return redirect(url_for("main.index"))
 
-    def _get_level_names(self):
-        return [level.name() for level in self.game.levels]
+    def _check_rate_limit(self) -> float:
+        """Take a query from the player's budget, return the seconds to wait if empty.
+
+        Clients without a session cookie, like most scripts, are limited by IP.
+        """
+        limiter = self.game.rate_limiter
+        if limiter is None:
+            return 0.0
+        key = request.remote_addr
+        if limiter.key == "session" and "sid" in session:
+            key = session["sid"]
+        retry_after = limiter.acquire(key)
+        if retry_after:
+            RATE_LIMITED.inc()
+        return retry_after
+
+    def _too_many_requests(self, retry_after: float):
+        response = jsonify(
+            response="I need a moment to catch my breath, try again shortly."
+        )
+        response.headers["Retry-After"] = str(math.ceil(retry_after))
+        return response, 429
+
+    def _model_unavailable(self, error: ModelError):
+        """Answer in the game when the model can't, instead of with a server error."""
+        logging.warning(f"Model query failed: {error}")
+        response = jsonify(response=MODEL_ERROR_MESSAGE)
+        if error.retry_after:
+            response.headers["Retry-After"] = str(math.ceil(error.retry_after))
+        return response, 503
+
+    def _get_session_id(self) -> str:
+        if "sid" not in session:
+            session["sid"] = uuid.uuid4().hex
+        return session["sid"]
+
+    def _load_state(self, level: int) -> PTBGameState:
+        """Load the player's state, switching to level if they were on another one."""
+        self.game.check_level_exists(level)
+        data = self.store.get(self._get_session_id())
+        if data is None:
+            return self.game.new_state(level)
+        try:
+            state = PTBGameState.from_json(data)
+        except ValueError:
+            logging.warning("Discarding invalid stored game state")
+            return self.game.new_state(level)
+        if state.level_number != level:
+            self.game.load_level(state, level)
+        return state
+
+    def _save_state(self, state: PTBGameState):
+        self.store.set(self._get_session_id(), state.to_json())
+
+    def _get_page_context(self) -> dict:
+        """Return the template values shared by all players.
+
+        They are built once and again only when the game's levels change,
+        which also clears the rendered pages.
+        """
+        levels = tuple(self.game.levels)
+        if levels != self._context_levels:
+            model_info = self.game.model.get_info()
+            self._page_context = {
+                "level_names": tuple(level.name() for level in levels),
+                "level_count": len(levels),
+                "hints": tuple(level.hint() for level in levels),
+                "config": {
+                    key: model_info[key]
+                    for key in PUBLIC_MODEL_INFO
+                    if key in model_info
+                },
+            }
+            self._pages = {}
+            self._context_levels = levels
+        return self._page_context
+
+    def _cached_page(self, template: str) -> Response:
+        """Serve a page that is the same for every player, rendered only once.
+
+        Browsers may reuse it for a few minutes and revalidate it with its ETag.
+        """
+        context = self._get_page_context()
+        page = self._pages.get(template)
+        if page is None:
+            body = render_template(template, **context)
+            etag = hashlib.sha256(body.encode("UTF-8")).hexdigest()[:32]
+            page = self._pages[template] = (body, etag)
+        body, etag = page
+        response = Response(body, mimetype="text/html")
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = PAGE_MAX_AGE
+        return response.make_conditional(request)
+
+
+def _done_event(response: str) -> str:
+    """Return the server-sent event that ends a stream with the final response."""
+    return f"event: done\ndata: {json.dumps({'response': response})}\n\n"
+
+
+@lru_cache(maxsize=256)
+def _get_file_hash(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+def _add_static_hash(endpoint: str, values: dict):
+    """Add a content hash to static URLs, so they can be cached for long."""
+    if endpoint != "static" or "filename" not in values:
+        return
+    try:
+        values["v"] = _get_file_hash(
+            os.path.join(current_app.static_folder, values["filename"])
+        )
+    except OSError:
+        pass
 
-    def _get_level_count(self):
-        return len(self.game.levels)
 
-    def _get_level_hints(self):
-        return [level.hint() for level in self.game.levels]
+class GameFlask(Flask):
+    def get_send_file_max_age(self, filename: str | None) -> int | None:
+        if request.args.get("v"):
+            return STATIC_MAX_AGE
+        return super().get_send_file_max_age(filename)
 
 
-def create_app() -> Flask:
-    model_type = os.getenv("GTP_MODEL_TYPE", "ollama")
-    game = load_game(model_type=model_type)
-    app = Flask(__name__)
+def create_app(game: PTBGame | None = None) -> Flask:
+    if metrics_dir := os.getenv("GTP_METRICS_DIR"):
+        # Each gunicorn worker calls this, the workers' metrics are added up
+        REGISTRY.share(metrics_dir)
+    store = create_store(
+        os.getenv("GTP_SESSION_STORE", "memory"),
+        max_size=SESSION_MAX_COUNT,
+        ttl=SESSION_TTL,
+    )
+    if game is None:
+        game = load_game(model_type=os.getenv("GTP_MODEL_TYPE", "ollama"))
+    game.start_warmup()
+    app = GameFlask(__name__)
+    app.url_defaults(_add_static_hash)
     app.secret_key = "GuessThePasswordSecretSecret"
-    game_app = GameApp(game)
+    game_app = GameApp(game, store)
     app.register_blueprint(game_app.main)
     return app
@@ -0,0 +1,12 @@
+"""Gunicorn server hooks, used by the runserver command."""
+
+import gc
+
+from game.game import load_levels
+
+
+def on_starting(server):
+    """Build the levels in the master process, so forked workers share their memory."""
+    load_levels()
+    # Keep the garbage collector from writing to the shared pages in every worker
+    gc.freeze()
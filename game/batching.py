@@ -0,0 +1,109 @@
+import json
+import queue
+import threading
+import time
+from collections.abc import Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from pydantic import BaseModel
+
+from game.models import ModelInterface
+
+_Pending = tuple[str, str | None, dict | None, list[dict] | None, Future]
+
+
+class BatchConfig(BaseModel):
+    window: float = 0.01  # Seconds to wait for more queries after the first one
+    max_batch_size: int = 8
+
+
+class BatchingModelInterface(ModelInterface):
+    """Collects queries arriving close together and dispatches them as one batch.
+
+    Identical prompts within a batch share a single model call. The rest of
+    the batch is sent at once over the backend's pooled connections, so the
+    model server can process the requests together. A query waits at most
+    the batch window before it is dispatched. Queries only share a call when
+    their history and sampling options are the same too.
+    """
+
+    def __init__(self, model: ModelInterface, config: BatchConfig):
+        self.model = model
+        self.config = config
+        self._pending: queue.Queue[_Pending] = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=config.max_batch_size)
+        threading.Thread(target=self._dispatch_loop, daemon=True).start()
+
+    def query(
+        self,
+        query: str,
+        system: str | None = None,
+        options: dict | None = None,
+        history: list[dict] | None = None,
+    ) -> str:
+        future = Future()
+        self._pending.put((query, system, options, history, future))
+        return future.result()
+
+    def stream(
+        self,
+        query: str,
+        system: str | None = None,
+        options: dict | None = None,
+        history: list[dict] | None = None,
+    ) -> Iterator[str]:
+        # Streams are read by a single caller, there is nothing to share
+        yield from self.model.stream(query, system, options, history)
+
+    def get_info(self) -> dict:
+        return self.model.get_info()
+
+    def is_healthy(self) -> bool:
+        return self.model.is_healthy()
+
+    def warmup(self) -> bool:
+        return self.model.warmup()
+
+    def _dispatch_loop(self):
+        while True:
+            self._dispatch(self._collect_batch())
+
+    def _collect_batch(self) -> list[_Pending]:
+        batch = [self._pending.get()]
+        deadline = time.monotonic() + self.config.window
+        while len(batch) < self.config.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _dispatch(self, batch: list[_Pending]):
+        waiting: dict[str, tuple[tuple, list[Future]]] = {}
+        for query, system, options, history, future in batch:
+            key = json.dumps([query, system, options, history], sort_keys=True)
+            args = (query, system, options, history)
+            waiting.setdefault(key, (args, []))[1].append(future)
+
+        for args, futures in waiting.values():
+            self._executor.submit(self._run, *args, futures)
+
+    def _run(
+        self,
+        query: str,
+        system: str | None,
+        options: dict | None,
+        history: list[dict] | None,
+        futures: list[Future],
+    ):
+        try:
+            response = self.model.query(query, system, options, history)
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+        for future in futures:
+            future.set_result(response)
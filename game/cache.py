@@ -0,0 +1,117 @@
+import hashlib
+import json
+import threading
+from collections.abc import Iterator
+
+from pydantic import BaseModel
+
+from game.metrics import CACHE_REQUESTS
+from game.models import ModelInterface
+from game.storage import KeyValueStore
+
+
+class CacheConfig(BaseModel):
+    store: str = "memory"
+    max_size: int = 10000
+    ttl: float = 3600.0
+
+
+class CachedModelInterface(ModelInterface):
+    """Answers repeated prompts from a cache instead of querying the model again.
+
+    Keys hash the backend, model and the exact system prompt, history and
+    query. The system prompt contains the level's prompt and password, so
+    entries never cross levels. Queries with sampling options ask for a different answer
+    on purpose and skip the cache. Lookups are counted per backend and per
+    level, the level is found from its system prompt.
+    """
+
+    def __init__(
+        self,
+        model: ModelInterface,
+        store: KeyValueStore,
+        system_prompts: tuple[str, ...] = (),
+    ):
+        self.model = model
+        self.store = store
+        self._backend = model.get_info().get("backend", "")
+        self._levels = {system: level for level, system in enumerate(system_prompts)}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def query(
+        self,
+        query: str,
+        system: str | None = None,
+        options: dict | None = None,
+        history: list[dict] | None = None,
+    ) -> str:
+        if options:
+            return self.model.query(query, system, options, history)
+        key = self._get_key(query, system, history)
+        response = self._lookup(key, system)
+        if response is None:
+            response = self.model.query(query, system, options, history)
+            self.store.set(key, response)
+        return response
+
+    def stream(
+        self,
+        query: str,
+        system: str | None = None,
+        options: dict | None = None,
+        history: list[dict] | None = None,
+    ) -> Iterator[str]:
+        if options:
+            yield from self.model.stream(query, system, options, history)
+            return
+        key = self._get_key(query, system, history)
+        response = self._lookup(key, system)
+        if response is not None:
+            yield response
+            return
+
+        chunks = []
+        for chunk in self.model.stream(query, system, options, history):
+            chunks.append(chunk)
+            yield chunk
+        # Only reached when the stream was read to the end, not when it was aborted
+        self.store.set(key, "".join(chunks))
+
+    def get_info(self) -> dict:
+        return self.model.get_info()
+
+    def is_healthy(self) -> bool:
+        return self.model.is_healthy()
+
+    def warmup(self) -> bool:
+        return self.model.warmup()
+
+    def get_stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+    def _lookup(self, key: str, system: str | None) -> str | None:
+        response = self.store.get(key)
+        with self._lock:
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        CACHE_REQUESTS.inc(
+            backend=self._backend,
+            # Other prompts, like the judge's, aren't a level's
+            level=self._levels.get(system, "other"),
+            result="miss" if response is None else "hit",
+        )
+        return response
+
+    def _get_key(
+        self, query: str, system: str | None, history: list[dict] | None
+    ) -> str:
+        info = self.model.get_info()
+        # The model is wrapped, so its class doesn't tell the backend apart
+        key = json.dumps(
+            [info.get("backend"), info.get("model"), system, history, query]
+        )
+        return hashlib.sha256(key.encode("UTF-8")).hexdigest()
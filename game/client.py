@@ -0,0 +1,281 @@
+import random
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+from pydantic import BaseModel
+from requests.adapters import HTTPAdapter
+
+from game.metrics import CIRCUIT_OPENED, MODEL_RETRIES
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class ClientConfig(BaseModel):
+    connect_timeout: float = 5.0
+    read_timeout: float = 120.0
+    pool_size: int = 8
+    max_concurrent_requests: int = 8
+    max_retries: int = 2  # Retries after connection errors, 429 and 5xx responses
+    retry_backoff: float = 0.5  # Upper bound of the first retry's random delay
+    retry_backoff_max: float = 8.0
+    max_retry_after: float = 10.0  # Longer Retry-After waits fail the request instead
+    breaker_failures: int = 5  # Consecutive failures that open the circuit
+    breaker_reset: float = 30.0  # Seconds before an open circuit lets a trial through
+
+
+class ModelError(Exception):
+    """Raised when a model backend fails, can't be reached or answers unexpectedly."""
+
+    def __init__(
+        self,
+        message: str,
+        retry_after: float | None = None,
+        status_code: int | None = None,
+    ):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+    @property
+    def backend_failed(self) -> bool:
+        """Whether the backend itself failed, rather than rejecting the request."""
+        return self.status_code is None or self.status_code >= 500
+
+    @classmethod
+    def from_response(cls, response: requests.Response) -> "ModelError":
+        retry_after = response.headers.get("Retry-After")
+        return cls(
+            f"Request failed with status code {response.status_code}: {response.text}",
+            retry_after=_parse_retry_after(retry_after) if retry_after else None,
+            status_code=response.status_code,
+        )
+
+
+class CircuitBreaker:
+    """Fails fast while a backend keeps failing.
+
+    After failure_threshold failed requests in a row the circuit opens and
+    requests are refused for reset_timeout seconds. Then one trial request
+    is let through, which closes the circuit when it succeeds and opens it
+    again when it fails. A request is checked once and reports once, after
+    its last retry.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened_at: float | None = None
+        self._trial_at: float | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def check(self):
+        """Raise ModelError if requests to the backend should not be tried now."""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            now = time.monotonic()
+            remaining = self._opened_at + self.reset_timeout - now
+            # A trial that never reported back is given up after reset_timeout
+            trial_running = (
+                self._trial_at is not None and now - self._trial_at < self.reset_timeout
+            )
+            if remaining > 0 or trial_running:
+                raise ModelError(
+                    f"{self.name} is unavailable after {self.failures} failures.",
+                    retry_after=max(remaining, 1.0),
+                )
+            self._trial_at = now
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+            self._trial_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_at = None
+            if self.failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    CIRCUIT_OPENED.inc(host=self.name)
+                self._opened_at = time.monotonic()
+
+
+class HTTPClient:
+    """Keep-alive HTTP session for one backend, with timeouts and a cap on in-flight requests.
+
+    Posts are retried with jittered exponential backoff after connection
+    errors, timeouts and 429 or 5xx responses, waiting at least as long as
+    the server's Retry-After. A circuit breaker refuses requests right away
+    while the backend keeps failing, so a stalled server doesn't hold up
+    every player for the full timeout.
+    """
+
+    def __init__(self, config: ClientConfig):
+        self.config = config
+        self._timeout = (config.connect_timeout, config.read_timeout)
+        self._semaphore = threading.BoundedSemaphore(config.max_concurrent_requests)
+        self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=config.pool_size, pool_block=True
+        )
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._breaker: CircuitBreaker | None = None
+        self._breaker_lock = threading.Lock()
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self._session.get(url, timeout=self._timeout, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        """Post a request, retrying it, and return the final response.
+
+        Raises ModelError when the backend can't be reached or its circuit is open.
+        """
+        breaker = self._get_breaker(url)
+        # Checked once per request, so a trial's own retries are let through
+        breaker.check()
+        attempt = 0
+        while True:
+            with self._slot():
+                try:
+                    response = self._session.post(url, timeout=self._timeout, **kwargs)
+                except requests.RequestException as e:
+                    delay = self._handle_error(breaker, url, e, attempt)
+                else:
+                    delay = self._handle_response(breaker, response, attempt)
+                    if delay is None:
+                        return response
+                    response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    @contextmanager
+    def stream(self, url: str, **kwargs) -> Iterator[requests.Response]:
+        """Post a streaming request, holding a concurrency slot until the body is closed.
+
+        Only the request is retried, never a response that is already being read.
+        Errors while reading the body, like a read timeout, raise ModelError.
+        """
+        breaker = self._get_breaker(url)
+        breaker.check()
+        attempt = 0
+        while True:
+            with self._slot():
+                try:
+                    response = self._session.post(
+                        url, timeout=self._timeout, stream=True, **kwargs
+                    )
+                except requests.RequestException as e:
+                    delay = self._handle_error(breaker, url, e, attempt)
+                else:
+                    with response:
+                        delay = self._handle_response(breaker, response, attempt)
+                        if delay is None:
+                            try:
+                                yield response
+                            except requests.RequestException as e:
+                                # The backend stalled or dropped the connection mid-body
+                                breaker.record_failure()
+                                raise ModelError(
+                                    f"Reading the response from {url} failed: {e}"
+                                ) from e
+                            return
+            time.sleep(delay)
+            attempt += 1
+
+    def _handle_error(
+        self,
+        breaker: CircuitBreaker,
+        url: str,
+        error: requests.RequestException,
+        attempt: int,
+    ) -> float:
+        """Return the delay before the next attempt, or raise if there is none."""
+        delay = self._get_retry_delay(attempt)
+        if delay is None:
+            breaker.record_failure()
+            raise ModelError(f"Request to {url} failed: {error}") from error
+        MODEL_RETRIES.inc(host=breaker.name, reason=type(error).__name__)
+        return delay
+
+    def _handle_response(
+        self, breaker: CircuitBreaker, response: requests.Response, attempt: int
+    ) -> float | None:
+        """Return the delay before the next attempt, or None to use this response."""
+        if response.status_code not in RETRY_STATUS_CODES:
+            breaker.record_success()
+            return None
+        delay = self._get_retry_delay(attempt, response.headers.get("Retry-After"))
+        if delay is None:
+            if response.status_code == 429:
+                # A rate limit shows the backend is up and answering
+                breaker.record_success()
+            else:
+                breaker.record_failure()
+            return None
+        MODEL_RETRIES.inc(host=breaker.name, reason=str(response.status_code))
+        return delay
+
+    def _get_retry_delay(
+        self, attempt: int, retry_after: str | None = None
+    ) -> float | None:
+        if attempt >= self.config.max_retries:
+            return None
+        backoff = min(
+            self.config.retry_backoff * 2**attempt, self.config.retry_backoff_max
+        )
+        delay = random.uniform(0, backoff)
+        if retry_after is not None:
+            wait = _parse_retry_after(retry_after)
+            if wait > self.config.max_retry_after:
+                return None
+            delay = max(delay, wait)
+        return delay
+
+    def _get_breaker(self, url: str) -> CircuitBreaker:
+        # Created on first use, the client only learns its host from the URL
+        with self._breaker_lock:
+            if self._breaker is None:
+                self._breaker = CircuitBreaker(
+                    urlparse(url).netloc,
+                    self.config.breaker_failures,
+                    self.config.breaker_reset,
+                )
+            return self._breaker
+
+    @contextmanager
+    def _slot(self) -> Iterator[None]:
+        if not self._semaphore.acquire(timeout=self.config.read_timeout):
+            raise ModelError(
+                f"No free slot after {self.config.read_timeout}s, "
+                f"{self.config.max_concurrent_requests} requests are in flight."
+            )
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+
+
+def _parse_retry_after(value: str) -> float:
+    """Return the seconds to wait from a Retry-After header, in seconds or as a date."""
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return 0.0
@@ -0,0 +1,177 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+from pydantic import BaseModel
+
+from game.metrics import EVENT_BATCH_LATENCY, EVENTS_DROPPED
+
+
+class EventLogConfig(BaseModel):
+    sink: str = "sqlite:///events.db"  # Or 'jsonl:///<directory>'
+    batch_size: int = 500
+    flush_interval: float = 1.0  # Seconds an event waits at most before it is written
+    max_queue: int = 10000  # Events are dropped when the writer falls this far behind
+    segment_size: int = 64 * 1024 * 1024  # Bytes per JSONL file before rotating
+    retention_days: float | None = None  # Delete older SQLite events
+
+
+class EventSink(ABC):
+    """Defines where batches of events are written to."""
+
+    @abstractmethod
+    def write(self, events: list[dict]) -> None:
+        """Append events in one operation."""
+
+
+class SQLiteEventSink(EventSink):
+    """Appends events to a table in a WAL mode database, one transaction per batch."""
+
+    def __init__(self, path: str | Path, retention_days: float | None = None):
+        self.path = str(path)
+        self.retention_days = retention_days
+        self._last_prune = 0.0
+        # Only used from the writer thread
+        self._connection = sqlite3.connect(
+            self.path, timeout=10.0, check_same_thread=False
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS events (time REAL NOT NULL, "
+                "type TEXT NOT NULL, player TEXT, level INTEGER, data TEXT NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS events_type_time ON events (type, time)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS events_player ON events (player)"
+            )
+
+    def write(self, events: list[dict]) -> None:
+        with self._connection:
+            self._connection.executemany(
+                "INSERT INTO events (time, type, player, level, data) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (
+                        e["time"],
+                        e["type"],
+                        e.get("player"),
+                        e.get("level"),
+                        json.dumps(e),
+                    )
+                    for e in events
+                ],
+            )
+            if self.retention_days and time.time() - self._last_prune > 3600:
+                self._last_prune = time.time()
+                self._connection.execute(
+                    "DELETE FROM events WHERE time < ?",
+                    (time.time() - self.retention_days * 86400,),
+                )
+
+
+class JSONLEventSink(EventSink):
+    """Appends events to JSON lines files, starting a new file every segment_size bytes.
+
+    Every worker process writes its own segments, named by start time and pid.
+    """
+
+    def __init__(self, directory: str | Path, segment_size: int):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_size = segment_size
+        self._file = None
+
+    def write(self, events: list[dict]) -> None:
+        if self._file is None or self._file.tell() >= self.segment_size:
+            self._rotate()
+        self._file.write("".join(json.dumps(e) + "\n" for e in events))
+        self._file.flush()
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+        name = f"events-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl"
+        self._file = (self.directory / name).open("a", encoding="UTF-8")
+
+
+class EventLog:
+    """Records game events without blocking the request that produced them.
+
+    Events are queued and a background thread writes them in batches. When
+    the queue is full, new events are dropped and counted instead of making
+    players wait for the disk.
+    """
+
+    def __init__(self, sink: EventSink, config: EventLogConfig):
+        self.sink = sink
+        self.config = config
+        self._queue: queue.Queue[dict] = queue.Queue(maxsize=config.max_queue)
+        threading.Thread(target=self._write_loop, daemon=True).start()
+        atexit.register(self.flush)
+
+    def record(self, type: str, **fields):
+        event = {"time": time.time(), "type": type, **fields}
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            EVENTS_DROPPED.inc(type=type)
+
+    def flush(self, timeout: float = 5.0):
+        """Wait until the queued events have been written."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def _write_loop(self):
+        while True:
+            batch = self._collect_batch()
+            start = time.perf_counter()
+            try:
+                self.sink.write(batch)
+            except Exception as e:
+                logging.warning(f"Failed to write {len(batch)} events: {e}")
+            EVENT_BATCH_LATENCY.observe(time.perf_counter() - start)
+            for _ in batch:
+                self._queue.task_done()
+
+    def _collect_batch(self) -> list[dict]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.config.flush_interval
+        while len(batch) < self.config.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+
+def create_event_log(config: EventLogConfig) -> EventLog:
+    """Create an event log writing to 'sqlite:///path/to/db' or 'jsonl:///directory'."""
+    if config.sink.startswith("sqlite:///"):
+        sink = SQLiteEventSink(
+            config.sink.removeprefix("sqlite:///"), config.retention_days
+        )
+    elif config.sink.startswith("jsonl:///"):
+        sink = JSONLEventSink(
+            config.sink.removeprefix("jsonl:///"), config.segment_size
+        )
+    else:
+        raise ValueError(
+            f"Unsupported event sink: {config.sink}. "
+            "Valid options are: sqlite:///<path>, jsonl:///<directory>"
+        )
+    return EventLog(sink, config)
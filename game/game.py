@@ -1,20 +1,56 @@
 import json
+import logging
+import threading
+import time
+from collections import deque
+from collections.abc import Iterator
+from contextlib import nullcontext
 from enum import Enum
 from pathlib import Path
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel
 
-from game.levels.censor import LevelCensor
-from game.levels.extended_prompt import LevelExtendedPrompt
-from game.levels.no_guard import LevelNoGuard
-from game.levels.simple_prompt import LevelSimplePrompt
+from game.batching import BatchConfig, BatchingModelInterface
+from game.cache import CacheConfig, CachedModelInterface
+from game.events import EventLog, EventLogConfig, create_event_log
+from game.input_guard import InputGuardConfig, InputPipeline, default_stages
+from game.judge import JudgeConfig, ResponseJudge, create_judge
+from game.metrics import (GUARD_LATENCY, PROMPT_LATENCY, PROMPT_TOKENS,
+                          QUERIES, QUERY_ERRORS)
 from game.models import (ChatGPTInterface, ChatGPTInterfaceConfig,
                          ClaudeInterface, ClaudeInterfaceConfig,
-                         ModelInterface, OllamaInterface,
-                         OllamaInterfaceConfig)
+                         InstrumentedModelInterface, ModelInterface,
+                         OllamaInterface, OllamaInterfaceConfig)
+from game.prompt_builder import PromptBuilder, PromptConfig
+from game.ratelimit import RateLimitConfig, TokenBucketLimiter, create_limiter
+from game.registry import LevelRegistry, load_registry
+from game.routing import RoutingConfig, RoutingModelInterface
+from game.scanners import ResponseScanner
+from game.scheduler import FairScheduler, SchedulerConfig
+from game.semantic_cache import (SemanticCache, SemanticCacheConfig,
+                                 create_semantic_cache)
+from game.speculation import SpeculationConfig, SpeculativeGenerator
+from game.storage import create_store
 
 CONVERSATION_HISTORY_LENGTH = 6
 CONVERSATION_BUFFER_LENGTH = CONVERSATION_HISTORY_LENGTH * 5
+WARMUP_RETRY_INTERVAL = 5.0
+DEFAULT_CONFIG_DIR = Path(__file__).parent.parent / "config"
+
+
+class GameConfig(BaseModel):
+    levels: str = "levels.json"  # Level specs in the config directory
+    prompt: PromptConfig = PromptConfig()
+    input_guard: InputGuardConfig = InputGuardConfig()
+    rate_limit: RateLimitConfig | None = RateLimitConfig()
+    scheduler: SchedulerConfig | None = SchedulerConfig()
+    event_log: EventLogConfig | None = None
+    judge: JudgeConfig | None = None
+    speculation: SpeculationConfig | None = None
+    semantic_cache: SemanticCacheConfig | None = None
+    response_cache: CacheConfig | None = None
+    routing: RoutingConfig = RoutingConfig()
+    batching: BatchConfig | None = None
 
 
 class Users(Enum):
@@ -23,44 +59,145 @@ class Users(Enum):
     user = "user"
 
 
-class Message(BaseModel):
-    user: Users
-    message: str
+class Message:
+    __slots__ = ("user", "message", "tokens")
+
+    def __init__(self, user: Users, message: str):
+        self.user = user
+        self.message = message
+        self.tokens = None  # Counted once, when the prompt builder first needs it
+
+
+class PTBConversation:
+    """Ring buffer of the last CONVERSATION_BUFFER_LENGTH messages.
+
+    The recent history that goes into the prompt is turned into chat messages
+    once by the prompt builder and reused until the next message is added.
+    """
+
+    __slots__ = ("history", "rendered_history")
+
+    def __init__(self, history: list[Message] = ()):
+        self.history = deque(history, maxlen=CONVERSATION_BUFFER_LENGTH)
+        self.rendered_history = None
+
+    def append(self, message: Message):
+        self.history.append(message)
+        self.rendered_history = None
+
 
+class PTBGameState:
+    """Per-player game state, kept apart from the shared game so it can be stored."""
 
-class PTBConversation(BaseModel):
-    system: Message
-    history: list[Message] = Field([], max_length=CONVERSATION_HISTORY_LENGTH)
+    __slots__ = ("level_number", "conversation")
+
+    def __init__(self, level_number: int = 0, conversation: PTBConversation = None):
+        self.level_number = level_number
+        self.conversation = conversation or PTBConversation()
+
+    def to_json(self) -> str:
+        history = [[m.user.value, m.message] for m in self.conversation.history]
+        return json.dumps({"level": self.level_number, "history": history})
+
+    @classmethod
+    def from_json(cls, data: str) -> "PTBGameState":
+        """Load a stored state, raising ValueError if it is malformed."""
+        try:
+            loaded = json.loads(data)
+            level_number = loaded["level"]
+            history = [
+                Message(Users(user), message) for user, message in loaded["history"]
+            ]
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid game state: {e}") from e
+        if not isinstance(level_number, int) or not all(
+            isinstance(m.message, str) for m in history
+        ):
+            raise ValueError("Invalid game state: wrong field types")
+        return cls(level_number, PTBConversation(history))
+
+
+class StreamEvent(BaseModel):
+    """Part of a streamed reply, the final event carries the guarded full response."""
+
+    chunk: str = ""
+    response: str | None = None
 
 
 class PTBGame:
-    def __init__(self, levels: list[str], model: ModelInterface):
+    def __init__(
+        self,
+        registry: LevelRegistry,
+        model: ModelInterface,
+        prompt_builder: PromptBuilder | None = None,
+        input_guard: InputGuardConfig | None = None,
+        scheduler: FairScheduler | None = None,
+        rate_limiter: TokenBucketLimiter | None = None,
+        events: EventLog | None = None,
+        judge: ResponseJudge | None = None,
+        speculator: SpeculativeGenerator | None = None,
+        semantic_cache: SemanticCache | None = None,
+    ):
         self.model = model
-        self.levels = levels
-        self.level_number = 0
-        self.passwords = [l.password for l in levels]
-        self.level = self.levels[self.level_number]
-        self._set_password_prompt(self.passwords[self.level_number])
-        self._reset_conversation_history()
+        self.events = events
+        self.judge = judge
+        self.speculator = speculator
+        self.semantic_cache = semantic_cache
+        self.scheduler = scheduler
+        # Checked by the web app before a query is handled
+        self.rate_limiter = rate_limiter
+        self.levels = registry.levels
+        self.passwords = [l.password for l in self.levels]
+        self.system_prompts = registry.system_prompts
+        self.prompt_builder = prompt_builder or PromptBuilder(
+            "ollama", "", PromptConfig()
+        )
+        # Token counts depend on the backend's tokenizer, so each game counts them
+        self.repeated_prompts = tuple(
+            (prompt, self.prompt_builder.tokenizer.count(prompt))
+            for prompt in (level.get_repeated_prompt() for level in self.levels)
+        )
+        # The shared stages are built once and used by every level
+        shared_stages = default_stages(input_guard or InputGuardConfig())
+        self.input_pipelines = [
+            InputPipeline(shared_stages + level.input_stages()) for level in self.levels
+        ]
+        self.ready = threading.Event()
+
+    def start_warmup(self, retry_interval: float = WARMUP_RETRY_INTERVAL):
+        """Warm up the model in the background until it is ready for queries."""
+        threading.Thread(
+            target=self._warmup, args=(retry_interval,), daemon=True
+        ).start()
+
+    def is_ready(self) -> bool:
+        return self.ready.is_set()
+
+    def new_state(self, level: int = 0) -> PTBGameState:
+        self.check_level_exists(level)
+        return PTBGameState(level_number=level)
 
     def check_level_exists(self, level: int) -> None:
         if level < 0 or level >= len(self.levels):
             raise IndexError(f"Could not find level {level}.")
 
-    def load_level(self, level: int) -> int:
-        self.level_number = level
+    def load_level(self, state: PTBGameState, level: int) -> int:
         self.check_level_exists(level)
-        self.level = self.levels[level]
-        self._set_password_prompt(self.passwords[level])
-        self._reset_conversation_history()
+        state.level_number = level
+        state.conversation = PTBConversation()
         return level
 
     def get_level_password(self, level: int) -> str:
-        return self.passwords[self.level_number]
+        return self.passwords[level]
 
-    def level_password_unlock(self, level: int, user_password: str) -> bool:
+    def level_password_unlock(
+        self, level: int, user_password: str, player: str | None = None
+    ) -> bool:
         next_level_password = self.get_level_password(level)
-        return user_password.upper() == next_level_password.upper()
+        correct = user_password.upper() == next_level_password.upper()
+        if self.events:
+            self.events.record("password", player=player, level=level, correct=correct)
+        return correct
 
     def check_level_selection(self, level: int):
         if level >= len(self.levels) or level < 0:
@@ -78,77 +215,320 @@ class PTBGame:
     def display_challenge_win_message(self):
         return "Congratulations! You have completed every single level! Well done!"
 
-    def query_level(self, query: str):
-        if self.level:
-            return self._query(query)
+    def query_level(self, state: PTBGameState, query: str, player: str | None = None):
+        if self.levels:
+            return self._query(state, query, player)
         return "No level loaded."
 
-    def get_hint(self) -> str:
-        return self.level.hint()
+    def stream_level(
+        self, state: PTBGameState, query: str, player: str | None = None
+    ) -> Iterator[StreamEvent]:
+        """Query the level and yield the response while it is generated."""
+        start = time.perf_counter()
+        QUERIES.inc(level=state.level_number)
+        query_ok, query_not_ok_response = self._check_query(state, query, player)
+        if not query_ok:
+            self._record_query(
+                state, player, query, query_not_ok_response, "rejected", start
+            )
+            yield StreamEvent(response=query_not_ok_response)
+            return
+
+        cached_response, embedding = self._semantic_lookup(state, query)
+        if cached_response is not None:
+            response_ok, response_not_ok_response = self._check_response(
+                state, cached_response
+            )
+            yield StreamEvent(
+                response=self._finish_query(
+                    state,
+                    player,
+                    query,
+                    cached_response,
+                    response_ok,
+                    response_not_ok_response,
+                    start,
+                )
+            )
+            return
+
+        scanner = self._response_scanner(state.level_number)
+        chunks = []
+        with self._model_slot(player):
+            prompt, history = self._get_prompt(state, query)
+            stream = self.model.stream(
+                prompt,
+                system=self._get_system_prompt(state.level_number),
+                history=history,
+            )
+            try:
+                for chunk in stream:
+                    chunks.append(chunk)
+                    safe_chunk = scanner.feed(chunk)
+                    if scanner.blocked:
+                        break
+                    if safe_chunk:
+                        yield StreamEvent(chunk=safe_chunk)
+            except Exception:
+                QUERY_ERRORS.inc(level=state.level_number)
+                self._record_query(state, player, query, None, "error", start)
+                raise
+            finally:
+                # Stops the generation early when the scanner blocked the response
+                stream.close()
+
+        model_response = "".join(chunks)
+        response_ok, response_not_ok_response = self._check_response(
+            state, model_response
+        )
+        # Held back text is only shown once the full response passed the checks
+        if response_ok and not scanner.blocked and (remainder := scanner.flush()):
+            yield StreamEvent(chunk=remainder)
+        if not scanner.blocked:
+            # A blocked response was cut off, only complete ones are reused
+            self._semantic_store(state, embedding, model_response)
+        yield StreamEvent(
+            response=self._finish_query(
+                state,
+                player,
+                query,
+                model_response,
+                response_ok and not scanner.blocked,
+                response_not_ok_response,
+                start,
+            )
+        )
+
+    def get_hint(self, state: PTBGameState) -> str:
+        return self.levels[state.level_number].hint()
 
-    def get_level_name(self) -> str:
-        return self.level.name()
+    def get_level_name(self, state: PTBGameState) -> str:
+        return self.levels[state.level_number].name()
 
-    def get_conversation_history(self):
-        messages = []
-        for idx, m in enumerate(self._conversation.history):
-            if m.user is not Users.system:
-                messages.append(m)
-        return [m.message for m in messages]
+    def get_context_length(self, state: PTBGameState) -> int:
+        """Return how many recent messages fit in the prompt."""
+        return self.prompt_builder.get_history(state.conversation)[2]
 
-    def _query(self, query: str) -> str:
+    def get_conversation_history(self, state: PTBGameState) -> list[dict]:
+        return [
+            {"user": m.user.value, "message": m.message}
+            for m in state.conversation.history
+        ]
+
+    def _query(self, state: PTBGameState, query: str, player: str | None = None) -> str:
         """Query model with guardrails."""
-        query_ok, query_not_ok_response = self.level.check_query(query)
+        start = time.perf_counter()
+        QUERIES.inc(level=state.level_number)
+        query_ok, query_not_ok_response = self._check_query(state, query, player)
         if query_ok:
-            response = self.model.query(self._get_prompt_with_history(query))
-            response_ok, response_not_ok_response = self.level.check_response(response)
-            if not response_ok:
-                response = response_not_ok_response
-
-            self._update_conversation(query, response)
-            return response
+            model_response, embedding = self._semantic_lookup(state, query)
+            if model_response is None:
+                model_response, response_ok, response_not_ok_response = self._generate(
+                    state, query, player, start
+                )
+                self._semantic_store(state, embedding, model_response)
+            else:
+                response_ok, response_not_ok_response = self._check_response(
+                    state, model_response
+                )
+            return self._finish_query(
+                state,
+                player,
+                query,
+                model_response,
+                response_ok,
+                response_not_ok_response,
+                start,
+            )
+        self._record_query(
+            state, player, query, query_not_ok_response, "rejected", start
+        )
         return query_not_ok_response
 
-    def _update_conversation(self, prompt: str, response: str):
-        prompt_message = Message(user=Users.user, message=prompt)
-        response_message = Message(user=Users.model, message=response)
-
-        self._conversation.history.append(prompt_message)
-        self._conversation.history.append(response_message)
-
-        while len(self._conversation.history) > CONVERSATION_BUFFER_LENGTH:
-            self._conversation.history.pop(0)
-
-    def _get_prompt_with_history(self, query: str) -> str:
-        full_prompt = self.level.get_repeated_prompt()
-        full_prompt += "\n" + self._password_prompt
-
-        recent_history = self._conversation.history[-CONVERSATION_HISTORY_LENGTH:]
-
-        for m in recent_history:
-            full_prompt += "\n" + m.user.value + ": " + m.message
-
-        full_prompt += "\n" + Users.user.value + ": " + query
-        return full_prompt
-
-    def _set_password_prompt(self, password: str):
-        self._password_prompt = "The password is: " + password
-
-    def _reset_conversation_history(self):
-        self._conversation = PTBConversation(
-            system=Message(user=Users.system, message=self.level.get_system_prompt())
+    def _generate(
+        self, state: PTBGameState, query: str, player: str | None, start: float
+    ) -> tuple[str, bool, str]:
+        """Return the model response with the result of the response check."""
+        with self._model_slot(player):
+            try:
+                if self._speculates(state.level_number):
+                    return self._speculate(state, query)
+                prompt, history = self._get_prompt(state, query)
+                model_response = self.model.query(
+                    prompt,
+                    system=self._get_system_prompt(state.level_number),
+                    history=history,
+                )
+            except Exception:
+                QUERY_ERRORS.inc(level=state.level_number)
+                self._record_query(state, player, query, None, "error", start)
+                raise
+        return model_response, *self._check_response(state, model_response)
+
+    def _finish_query(
+        self,
+        state: PTBGameState,
+        player: str | None,
+        query: str,
+        model_response: str,
+        response_ok: bool,
+        response_not_ok_response: str,
+        start: float,
+    ) -> str:
+        """Add the turn to the conversation and log it, return the player's response."""
+        response, verdict = model_response, "ok"
+        if not response_ok:
+            response, verdict = response_not_ok_response, "blocked"
+
+        self._update_conversation(state, query, response)
+        self._record_query(state, player, query, model_response, verdict, start)
+        return response
+
+    def _semantic_lookup(
+        self, state: PTBGameState, query: str
+    ) -> tuple[str | None, list[float] | None]:
+        """Return a cached response to a similar first-turn query, and the embedding."""
+        if self.semantic_cache is None or state.conversation.history:
+            return None, None
+        return self.semantic_cache.get(state.level_number, query)
+
+    def _semantic_store(
+        self, state: PTBGameState, embedding: list[float] | None, response: str
+    ):
+        if self.semantic_cache is not None:
+            self.semantic_cache.put(state.level_number, embedding, response)
+
+    def _record_query(
+        self,
+        state: PTBGameState,
+        player: str | None,
+        query: str,
+        response: str | None,
+        verdict: str,
+        start: float,
+    ):
+        """Log a query with the model's own response and the guards' verdict."""
+        if self.events is None:
+            return
+        self.events.record(
+            "query",
+            player=player,
+            level=state.level_number,
+            query=query,
+            response=response,
+            verdict=verdict,
+            latency=time.perf_counter() - start,
         )
 
-
-def load_game(model_type: str = "ollama") -> PTBGame:
-    config_dir = Path(__file__).parent.parent / "config"
-    levels = [
-        LevelNoGuard("UPINTHECLAUDES"),
-        LevelSimplePrompt("THEFLOORISLLAMA"),
-        LevelCensor("STABLECONFUSION"),
-        LevelExtendedPrompt("GROCKTOPUS"),
-    ]
-
+    def _warmup(self, retry_interval: float):
+        while True:
+            try:
+                if self.model.warmup() and (self.judge is None or self.judge.warmup()):
+                    self.ready.set()
+                    logging.info("Model is ready")
+                    return
+            except Exception as e:
+                logging.warning(f"Model warm-up failed: {e}")
+            time.sleep(retry_interval)
+
+    def _speculates(self, level: int) -> bool:
+        return self.speculator is not None and self.speculator.applies(level)
+
+    def _speculate(self, state: PTBGameState, query: str) -> tuple[str, bool, str]:
+        """Generate candidates on the free model slots and return the first safe one."""
+        extra_slots = self.speculator.config.candidates - 1
+        if self.scheduler is not None:
+            # Only spare capacity is used, players waiting for a slot come first
+            extra_slots = sum(self.scheduler.try_acquire() for _ in range(extra_slots))
+        try:
+            prompt, history = self._get_prompt(state, query)
+            return self.speculator.generate(
+                prompt,
+                self._get_system_prompt(state.level_number),
+                history,
+                1 + extra_slots,
+                self.levels[state.level_number].response_scanner,
+                lambda response: self._check_response(state, response),
+            )
+        finally:
+            if self.scheduler is not None:
+                for _ in range(extra_slots):
+                    self.scheduler.release()
+
+    def _model_slot(self, player: str | None):
+        """Wait for a fair share of the model, raises ModelBusyError if it is full."""
+        if self.scheduler is None:
+            return nullcontext()
+        return self.scheduler.slot(player)
+
+    def _check_query(
+        self, state: PTBGameState, query: str, player: str | None = None
+    ) -> tuple[bool, str]:
+        with GUARD_LATENCY.time(level=state.level_number, check="query"):
+            query_ok, response = self.input_pipelines[state.level_number].check(
+                query, state.conversation.history, player, level=state.level_number
+            )
+            if not query_ok:
+                return query_ok, response
+            return self.levels[state.level_number].check_query(query)
+
+    def _check_response(self, state: PTBGameState, response: str) -> tuple[bool, str]:
+        level = self.levels[state.level_number]
+        with GUARD_LATENCY.time(level=state.level_number, check="response"):
+            if self._judges(state.level_number):
+                return level.check_response(response, judge=self.judge)
+            return level.check_response(response)
+
+    def _response_scanner(self, level: int) -> ResponseScanner:
+        if self._judges(level):
+            return self.levels[level].response_scanner(judge=self.judge)
+        return self.levels[level].response_scanner()
+
+    def _judges(self, level: int) -> bool:
+        # Only levels that ask for it get the judge, custom guards may not take it
+        return self.judge is not None and self.levels[level].uses_judge()
+
+    def _update_conversation(self, state: PTBGameState, prompt: str, response: str):
+        state.conversation.append(Message(Users.user, prompt))
+        state.conversation.append(Message(Users.model, response))
+
+    def _get_prompt(self, state: PTBGameState, query: str) -> tuple[str, list[dict]]:
+        """Return the prompt for this turn and the earlier turns as chat messages."""
+        with PROMPT_LATENCY.time(level=state.level_number):
+            repeated_prompt, repeated_tokens = self.repeated_prompts[state.level_number]
+            prompt, history, tokens = self.prompt_builder.build(
+                repeated_prompt, state.conversation, query, repeated_tokens
+            )
+        PROMPT_TOKENS.observe(tokens, level=state.level_number)
+        return prompt, history
+
+    def _get_system_prompt(self, level: int) -> str:
+        """Return the level's fixed prompt, identical at every turn of the level."""
+        return self.system_prompts[level]
+
+
+def load_levels(config_dir: Path | None = None) -> LevelRegistry:
+    """Load the level registry, cached so later calls in this process share it."""
+    config_dir = config_dir or DEFAULT_CONFIG_DIR
+    return _load_levels(config_dir, _load_game_config(config_dir))
+
+
+def _load_game_config(config_dir: Path) -> GameConfig:
+    game_config_path = config_dir / "game.json"
+    if game_config_path.exists():
+        return GameConfig(**json.loads(game_config_path.read_text(encoding="UTF-8")))
+    return GameConfig()
+
+
+def _load_levels(config_dir: Path, game_config: GameConfig) -> LevelRegistry:
+    levels_path = config_dir / game_config.levels
+    if not levels_path.exists():
+        levels_path = DEFAULT_CONFIG_DIR / game_config.levels
+    return load_registry(levels_path.resolve())
+
+
+def load_game(model_type: str = "ollama", config_dir: Path | None = None) -> PTBGame:
+    config_dir = config_dir or DEFAULT_CONFIG_DIR
     config_mapping = {
         "ollama": ("ollama.json", OllamaInterfaceConfig, OllamaInterface),
         "chatgpt": ("chatgpt.json", ChatGPTInterfaceConfig, ChatGPTInterface),
@@ -163,8 +543,63 @@ def load_game(model_type: str = "ollama") -> PTBGame:
             f"Unsupported model type: {model_type}. Valid options are: {valid_options}"
         )
 
+    game_config = _load_game_config(config_dir)
+    registry = _load_levels(config_dir, game_config)
+
     config_path = config_dir / config_file
-    config = config_class(**json.loads(config_path.read_text(encoding="UTF-8")))
-    model = model_class(config)
+    config_data = json.loads(config_path.read_text(encoding="UTF-8"))
+    if isinstance(config_data, list):
+        # A list of backends, e.g. several Ollama hosts, shares the load
+        models = [
+            InstrumentedModelInterface(
+                model_class(config_class(**c)), backend=f"{model_type}-{i}"
+            )
+            for i, c in enumerate(config_data)
+        ]
+        model = RoutingModelInterface(models, game_config.routing)
+    else:
+        model = InstrumentedModelInterface(
+            model_class(config_class(**config_data)), backend=model_type
+        )
 
-    return PTBGame(levels, model)
+    if game_config.batching:
+        model = BatchingModelInterface(model, game_config.batching)
+
+    if game_config.response_cache:
+        cache = game_config.response_cache
+        store = create_store(cache.store, max_size=cache.max_size, ttl=cache.ttl)
+        model = CachedModelInterface(model, store, registry.system_prompts)
+
+    prompt_builder = PromptBuilder(
+        model_type, model.get_info().get("model", ""), game_config.prompt
+    )
+    scheduler = None
+    if game_config.scheduler:
+        scheduler = FairScheduler(game_config.scheduler)
+    rate_limiter = None
+    if game_config.rate_limit:
+        rate_limiter = create_limiter(game_config.rate_limit)
+    events = None
+    if game_config.event_log:
+        events = create_event_log(game_config.event_log)
+    judge = None
+    if game_config.judge:
+        judge = create_judge(game_config.judge, model)
+    speculator = None
+    if game_config.speculation:
+        speculator = SpeculativeGenerator(model, game_config.speculation)
+    semantic_cache = None
+    if game_config.semantic_cache:
+        semantic_cache = create_semantic_cache(game_config.semantic_cache)
+    return PTBGame(
+        registry,
+        model,
+        prompt_builder,
+        game_config.input_guard,
+        scheduler,
+        rate_limiter,
+        events,
+        judge,
+        speculator,
+        semantic_cache,
+    )
@@ -5,6 +5,10 @@ from enum import Enum
 import requests
 from pydantic import BaseModel, Field
 
+from game.input_guard import InputStage
+from game.judge import ResponseJudge
+from game.scanners import PassthroughScanner, ResponseScanner
+
 
 class Guard(ABC):
     def __init__(self, password: str):
@@ -23,8 +27,37 @@ class Guard(ABC):
         """Checks the input query and returns true if ok and response on false."""
 
     @abstractmethod
-    def check_response(self, query: str) -> tuple[bool, str]:
-        """Checks the model response and returns true if ok and response on false."""
+    def check_response(
+        self, query: str, *, judge: ResponseJudge | None = None
+    ) -> tuple[bool, str]:
+        """Checks the model response and returns true if ok and response on false.
+
+        Levels whose uses_judge is true are given the game's judge, if it has
+        one, for a second opinion: submit the response to it first, run the
+        cheap checks while it works, then wait for leaks.
+        """
+
+    def uses_judge(self) -> bool:
+        """Return whether check_response and response_scanner take the judge."""
+        return False
+
+    def input_stages(self) -> list[InputStage]:
+        """Return cheap checks that reject queries before the model is called.
+
+        They are built once when the game starts and run before check_query,
+        together with the length and repeat checks every level has.
+        """
+        return []
+
+    def response_scanner(
+        self, *, judge: ResponseJudge | None = None
+    ) -> ResponseScanner:
+        """Return a new scanner that checks a streamed response while it arrives.
+
+        A scanner may only block responses that check_response rejects as well.
+        Levels that ask the judge should hold the text back for its verdict.
+        """
+        return PassthroughScanner()
 
     @abstractmethod
     def hint(self) -> str:
@@ -0,0 +1,180 @@
+import re
+from abc import ABC, abstractmethod
+from collections import deque
+
+from pydantic import BaseModel
+
+from game.metrics import INPUT_REJECTIONS
+
+_NON_WORD = re.compile(r"\W+")
+
+
+class InputGuardConfig(BaseModel):
+    max_query_length: int = 2000
+    duplicate_threshold: float = 0.9  # Similarity at which a query is a repeat
+    duplicate_lookback: int = 3  # Number of earlier queries to compare with
+    duplicate_min_length: int = 12  # Shorter replies, like "yes" or "ok", may repeat
+
+
+class InputStage(ABC):
+    """Checks a query before it is sent to the model.
+
+    Stages are built once per level and shared by all requests, so any
+    compilation happens in __init__ and check must be thread safe.
+    """
+
+    name: str = "stage"
+    cost: float = 1.0  # Relative cost, cheaper stages run first
+
+    @abstractmethod
+    def check(self, query: str, history: deque, player: str | None) -> tuple[bool, str]:
+        """Return true if the query may pass and the response on false."""
+
+
+class LengthStage(InputStage):
+    name = "length"
+    cost = 0.0
+
+    def __init__(
+        self,
+        max_length: int,
+        message: str = "That's a lot to read, could you keep it a bit shorter?",
+    ):
+        self.max_length = max_length
+        self.message = message
+
+    def check(self, query, history, player):
+        if len(query) > self.max_length:
+            return False, self.message
+        return True, ""
+
+
+class KeywordStage(InputStage):
+    """Rejects queries containing any of the keywords as a whole word."""
+
+    name = "keyword"
+    cost = 1.0
+
+    def __init__(self, keywords: list[str], message: str):
+        # One alternation is matched in a single pass, whatever the number of keywords
+        self._pattern = re.compile(
+            r"\b(?:" + "|".join(re.escape(k) for k in keywords) + r")\b",
+            re.IGNORECASE,
+        )
+        self.message = message
+
+    def check(self, query, history, player):
+        if self._pattern.search(query):
+            return False, self.message
+        return True, ""
+
+
+class PatternStage(InputStage):
+    """Rejects queries matching any of the regular expressions."""
+
+    name = "pattern"
+    cost = 2.0
+
+    def __init__(self, patterns: list[str], message: str):
+        self._pattern = re.compile(
+            "|".join(f"(?:{p})" for p in patterns), re.IGNORECASE
+        )
+        self.message = message
+
+    def check(self, query, history, player):
+        if self._pattern.search(query):
+            return False, self.message
+        return True, ""
+
+
+class DuplicateStage(InputStage):
+    """Rejects queries that are nearly the same as one of the last few queries.
+
+    Similarity is the overlap of character trigrams after normalizing case,
+    whitespace and punctuation. Queries shorter than min_length are never
+    repeats, short replies like "yes" are expected more than once.
+    """
+
+    name = "duplicate"
+    cost = 5.0
+
+    def __init__(
+        self,
+        threshold: float,
+        lookback: int,
+        min_length: int = 0,
+        message: str = "You just asked me that, try something new!",
+    ):
+        self.threshold = threshold
+        self.lookback = lookback
+        self.min_length = min_length
+        self.message = message
+
+    def check(self, query, history, player):
+        if len(query.strip()) < self.min_length:
+            return True, ""
+        shingles = _shingles(query)
+        if not shingles:
+            return True, ""
+        checked = 0
+        for message in reversed(history):
+            if message.user.value != "user":
+                continue
+            if _similarity(shingles, _shingles(message.message)) >= self.threshold:
+                return False, self.message
+            checked += 1
+            if checked == self.lookback:
+                break
+        return True, ""
+
+
+class InputPipeline:
+    """Runs input stages from cheap to expensive and stops at the first rejection.
+
+    Missing and blank queries are rejected before any stage runs, so stages
+    can rely on getting text.
+    """
+
+    def __init__(
+        self,
+        stages: list[InputStage],
+        empty_message: str = "You didn't ask me anything.",
+    ):
+        self.stages = sorted(stages, key=lambda stage: stage.cost)
+        self.empty_message = empty_message
+
+    def check(
+        self, query: str | None, history: deque, player: str | None = None, **labels
+    ) -> tuple[bool, str]:
+        if not isinstance(query, str) or not query.strip():
+            INPUT_REJECTIONS.inc(stage="empty", **labels)
+            return False, self.empty_message
+        for stage in self.stages:
+            query_ok, response = stage.check(query, history, player)
+            if not query_ok:
+                INPUT_REJECTIONS.inc(stage=stage.name, **labels)
+                return False, response
+        return True, ""
+
+
+def default_stages(config: InputGuardConfig) -> list[InputStage]:
+    """Return the abuse checks that apply to every level."""
+    return [
+        LengthStage(config.max_query_length),
+        DuplicateStage(
+            config.duplicate_threshold,
+            config.duplicate_lookback,
+            config.duplicate_min_length,
+        ),
+    ]
+
+
+def _shingles(text: str) -> set[str]:
+    text = _NON_WORD.sub(" ", text.lower()).strip()
+    return {text[i : i + 3] for i in range(max(len(text) - 2, 1))} if text else set()
+
+
+def _similarity(a: set[str], b: set[str]) -> float:
+    if not b:
+        return 0.0
+    return len(a & b) / len(a | b)
@@ -0,0 +1,228 @@
+import re
+import unicodedata
+from operator import itemgetter
+
+from game.scanners import ResponseScanner
+
+# Characters that are commonly swapped for a letter, mapped to one canonical
+# letter per look-alike group. Text is upper cased and NFKD normalized first,
+# which already removes accents and full width forms.
+_LOOKALIKES = {
+    "A": "4@ΑАᎪ",
+    "B": "8ΒВ",
+    "C": "ϹС",
+    "E": "3€ΕЕ",
+    "G": "69",
+    "H": "#ΗН",
+    "I": "1!|LΙІӀ",
+    "J": "Ј",
+    "K": "ΚК",
+    "M": "ΜМ",
+    "N": "ΝИ",
+    "O": "0ΟОΘ",
+    "P": "ΡР",
+    "S": "5$Ѕ",
+    "T": "7+ΤТ",
+    "X": "ΧХ",
+    "Y": "ΥУ",
+    "Z": "2Ζ",
+}
+_TABLE = str.maketrans(
+    {char: letter for letter, chars in _LOOKALIKES.items() for char in chars}
+)
+# Deleting ASCII separators with str.translate is much faster than a regex,
+# which is only needed for the rare non-ASCII leftovers
+_SEPARATORS = "".join(chr(i) for i in range(128) if not chr(i).isalnum())
+_STRIP = str.maketrans("", "", _SEPARATORS)
+# ASCII text, by far the most common, is translated as bytes, which costs a
+# table lookup per character instead of a dict lookup
+_ASCII_TABLE = bytes(
+    ord(chr(i).upper().translate(_TABLE)) if i < 128 else i for i in range(256)
+)
+_ASCII_SEPARATORS = _SEPARATORS.encode("ascii")
+_NON_ALNUM = re.compile(r"[^A-Z0-9]+")
+_LINE_PREFIX = _SEPARATORS + "•·–—"
+_first = itemgetter(0)
+# Below this length stripping separators would match ordinary text
+MIN_FUZZY_LENGTH = 5
+# Characters a streamed response is scanned in, fewer calls make streaming cheap
+SCAN_BATCH_SIZE = 128
+
+
+def translate(text: str) -> str:
+    """Upper case text and replace look-alike characters, keeping separators."""
+    if text.isascii():
+        return text.encode("ascii").translate(_ASCII_TABLE).decode("ascii")
+    return unicodedata.normalize("NFKD", text.upper()).translate(_TABLE)
+
+
+def fold(text: str) -> str:
+    """Reduce text to its canonical letters, dropping separators and accents."""
+    return _strip(translate(text))
+
+
+def _strip(translated: str) -> str:
+    if translated.isascii():
+        encoded = translated.encode("ascii")
+        return encoded.translate(None, _ASCII_SEPARATORS).decode("ascii")
+    return _NON_ALNUM.sub("", translated.translate(_STRIP))
+
+
+class LeakDetector:
+    """Finds a password in text even when it is obfuscated.
+
+    The password is folded once into the variants a response is searched for:
+    as written and reversed, ignoring case, separators, accents, homoglyphs and
+    leetspeak. Responses are folded the same way in a few linear passes, and
+    the first letters of lines and of whitespace separated words are searched
+    as well to catch acrostics.
+    """
+
+    def __init__(self, password: str):
+        folded = fold(password)
+        self.length = len(folded)
+        self.fuzzy = self.length >= MIN_FUZZY_LENGTH
+        self.variants = tuple({folded, folded[::-1]}) if self.fuzzy else ()
+        self._password = password.upper()
+        # What a scanner searches, the folded variants or the password as written
+        searched = self.variants or (self._password,)
+        self.pattern = re.compile("|".join(map(re.escape, searched)))
+        self.overlap = max(len(searched[0]) - 1, 0)
+
+    def contains_leak(self, text: str) -> bool:
+        if self._password in text.upper():
+            return True
+        if not self.fuzzy:
+            return False
+        translated = translate(text)
+        if self.search(_strip(translated)):
+            return True
+        lines = translated.split("\n")
+        line_initials = "".join(line.lstrip(_LINE_PREFIX)[:1] for line in lines)
+        word_initials = "".join(word[0] for word in translated.split())
+        return self.search(_strip(line_initials)) or self.search(_strip(word_initials))
+
+    def search(self, folded: str) -> bool:
+        """Return true if folded text contains one of the password variants."""
+        return any(variant in folded for variant in self.variants)
+
+    def scanner(self) -> "LeakScanner":
+        return LeakScanner(self)
+
+
+class LeakScanner(ResponseScanner):
+    """Streams a response through a LeakDetector.
+
+    Text is held back until it contains at least as many letters as the
+    password, so no more than a partial obfuscated password is ever shown.
+    Acrostics can't be held back, they are blocked once they complete.
+
+    Chunks are collected until at least batch_size characters arrived, then
+    translated and folded once. Only their letters are searched, together
+    with the folded tail of the text before them, so every character is
+    scanned once however the response is split into chunks.
+    """
+
+    def __init__(self, detector: LeakDetector, batch_size: int = SCAN_BATCH_SIZE):
+        self.detector = detector
+        self.batch_size = batch_size
+        self.blocked = False
+        self._holdback = max(detector.length - 1, 0)
+        self._pattern = detector.pattern
+        self._held_pattern = re.compile(r"(?:[^A-Z0-9]*[A-Z0-9]){%d}" % self._holdback)
+        self._pending = ""  # Scanned text that is held back
+        self._pending_letters = 0
+        self._unscanned = ""
+        self._tail = ""  # End of the scanned text, for leaks spanning batches
+        self._line_initials = ""
+        self._word_initials = ""
+        self._line_start = True
+        self._in_word = False
+
+    def feed(self, chunk: str) -> str:
+        # Called for every token, so it only collects the chunk
+        self._unscanned += chunk
+        if len(self._unscanned) < self.batch_size:
+            return ""
+        return self._scan()
+
+    def flush(self) -> str:
+        safe = self._scan() + self._pending
+        self._pending = ""
+        self._pending_letters = 0
+        return safe
+
+    def _scan(self) -> str:
+        """Check the unscanned text, return the text that can now be shown."""
+        text, self._unscanned = self._unscanned, ""
+        if self.blocked:
+            return ""
+        self._pending += text
+        if self._check(text):
+            self.blocked = True
+            self._pending = ""
+            return ""
+        excess = self._pending_letters - self._holdback
+        if excess <= 0:
+            return ""
+        split = self._split_point(excess)
+        safe, self._pending = self._pending[:split], self._pending[split:]
+        return safe
+
+    def _check(self, text: str) -> bool:
+        translated = translate(text)
+        folded = _strip(translated)
+        self._pending_letters += len(folded)
+        if not self.detector.fuzzy:
+            folded = text.upper()
+        # The tail is one character short of a password, so a match has new text
+        overlap = self.detector.overlap
+        window = self._tail + folded
+        if self._pattern.search(window):
+            return True
+        self._tail = window[-overlap:] if overlap else ""
+        if not self.detector.fuzzy:
+            return False
+
+        if self._line_start or "\n" in translated:
+            for i, line in enumerate(translated.split("\n")):
+                if i:
+                    self._line_start = True
+                if self._line_start and (line := line.lstrip(_LINE_PREFIX)):
+                    self._line_initials += _strip(line[0])
+                    self._line_start = False
+        words = translated.split()
+        if words and self._in_word and not translated[0].isspace():
+            # The text continues the last word of the previous batch
+            words = words[1:]
+        self._word_initials += _strip("".join(map(_first, words)))
+        if translated:
+            self._in_word = not translated[-1].isspace()
+
+        if self._pattern.search(self._line_initials) or self._pattern.search(
+            self._word_initials
+        ):
+            return True
+        # Searched first, a batch can add more initials than the password has
+        self._line_initials = self._line_initials[-overlap:] if overlap else ""
+        self._word_initials = self._word_initials[-overlap:] if overlap else ""
+        return False
+
+    def _split_point(self, excess: int) -> int:
+        """Return the index of the first held back letter in the pending text."""
+        if self._pending.isascii():
+            # Translation keeps ASCII text aligned with the original characters,
+            # the held back letters are matched from the end of the reversed text
+            self._pending_letters -= excess
+            held = self._held_pattern.match(translate(self._pending)[::-1])
+            return len(self._pending) - held.end()
+        released = 0
+        for i, char in enumerate(self._pending):
+            count = len(fold(char))
+            if count and released + count > excess:
+                break
+            released += count
+        else:
+            i = len(self._pending)
+        self._pending_letters -= released
+        return i
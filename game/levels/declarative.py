@@ -0,0 +1,84 @@
+from game.guard import Guard
+from game.input_guard import InputStage, KeywordStage, PatternStage
+from game.judge import ResponseJudge
+from game.leaks import LeakDetector
+from game.scanners import (BufferedScanner, PassthroughScanner,
+                           ResponseScanner, SubstringScanner)
+
+
+class DeclarativeLevel(Guard):
+    """A level defined by a LevelSpec instead of code.
+
+    Everything derived from the spec, like the rendered prompts, input stages
+    and leak detector, is built once here and only read afterwards.
+    """
+
+    def __init__(self, spec):
+        super().__init__(spec.password)
+        self.spec = spec
+        self._system_prompt = spec.render_system_prompt()
+        self._input_stages = []
+        if spec.input_keywords:
+            self._input_stages.append(
+                KeywordStage(spec.input_keywords, spec.input_message)
+            )
+        if spec.input_patterns:
+            self._input_stages.append(
+                PatternStage(spec.input_patterns, spec.input_message)
+            )
+        self._detector = LeakDetector(spec.password) if spec.censor == "fuzzy" else None
+
+    def get_system_prompt(self) -> str:
+        """Return system prompt for this level."""
+        return self._system_prompt
+
+    def get_repeated_prompt(self) -> str:
+        """Return a prompt that is injected at every user query"""
+        return self.spec.repeated_prompt
+
+    def check_query(self, query: str) -> tuple[bool, str]:
+        """Checks the input query and returns true if ok and response on false."""
+        return True, ""
+
+    def check_response(
+        self, query: str, *, judge: ResponseJudge | None = None
+    ) -> tuple[bool, str]:
+        """Checks the model response and returns true if ok and response on false."""
+        pending = None
+        if judge is not None:
+            # The judge works while the cheap checks run
+            pending = judge.submit(self.password, query)
+        if self.spec.censor == "exact" and self.password.upper() in query.upper():
+            return False, self.spec.censor_message
+        if self._detector and self._detector.contains_leak(query):
+            return False, self.spec.censor_message
+        if pending is not None and judge.leaks(pending):
+            return False, self.spec.censor_message
+        return True, ""
+
+    def input_stages(self) -> list[InputStage]:
+        return list(self._input_stages)
+
+    def uses_judge(self) -> bool:
+        return self.spec.judge
+
+    def response_scanner(
+        self, *, judge: ResponseJudge | None = None
+    ) -> ResponseScanner:
+        if self.spec.censor == "exact":
+            scanner = SubstringScanner(self.password)
+        elif self._detector:
+            scanner = self._detector.scanner()
+        else:
+            scanner = PassthroughScanner()
+        if judge is not None:
+            # Nothing is shown before the judge's verdict on the full response
+            return BufferedScanner(scanner)
+        return scanner
+
+    def hint(self) -> str:
+        """Message displayed at the start of a level."""
+        return self.spec.hint
+
+    def name(self) -> str:
+        return self.spec.name
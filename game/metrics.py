@@ -0,0 +1,295 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+FAST_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1)
+SHARE_INTERVAL = 5.0  # Seconds between a worker's writes to the shared directory
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self) -> dict[tuple, float]:
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def add(value: float, other: float) -> float:
+        return value + other
+
+    def render(self, values: dict[tuple, float]) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in values.items():
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._values: dict[tuple, tuple[list[int], float, int]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total, count = self._values.get(
+                key, ([0] * len(self.buckets), 0.0, 0)
+            )
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> dict[tuple, tuple[list[int], float, int]]:
+        with self._lock:
+            return {
+                key: (list(counts), total, count)
+                for key, (counts, total, count) in self._values.items()
+            }
+
+    @staticmethod
+    def add(
+        value: tuple[list[int], float, int], other: tuple[list[int], float, int]
+    ) -> tuple[list[int], float, int]:
+        counts = [a + b for a, b in zip(value[0], other[0])]
+        return counts, value[1] + other[1], value[2] + other[2]
+
+    def render(self, values: dict[tuple, tuple[list[int], float, int]]) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in values.items():
+            for bound, bucket_count in zip(self.buckets, counts):
+                bucket_key = key + (("le", str(bound)),)
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(bucket_key)} {bucket_count}"
+                )
+            inf_key = key + (("le", "+Inf"),)
+            lines.append(f"{self.name}_bucket{_format_labels(inf_key)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds the metrics of this worker process and renders them for Prometheus.
+
+    Gunicorn workers each have their own registry. Once share is called,
+    every worker writes its values to a directory shared by all of them and
+    render adds up the values of every worker, so scrapes show the same
+    totals whichever worker answers them. The other workers' values are at
+    most a share interval old, and those of workers that exited are kept.
+    """
+
+    def __init__(self):
+        self._metrics: list[Counter | Histogram] = []
+        self._directory: Path | None = None
+
+    def counter(self, name: str, help: str) -> Counter:
+        metric = Counter(name, help)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(
+        self, name: str, help: str, buckets: tuple = DEFAULT_BUCKETS
+    ) -> Histogram:
+        metric = Histogram(name, help, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def share(self, directory: str | Path, interval: float = SHARE_INTERVAL):
+        """Share this worker's metrics with the others in directory."""
+        started = self._directory is not None
+        self._directory = Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        if started:
+            return
+        threading.Thread(target=self._share_loop, args=(interval,), daemon=True).start()
+
+    def render(self) -> str:
+        if self._directory is None:
+            snapshots = [[metric.snapshot() for metric in self._metrics]]
+        else:
+            self._write_snapshot()
+            snapshots = self._read_snapshots()
+        lines = []
+        for i, metric in enumerate(self._metrics):
+            values = {}
+            for snapshot in snapshots:
+                for key, value in snapshot[i].items():
+                    values[key] = (
+                        metric.add(values[key], value) if key in values else value
+                    )
+            lines.extend(metric.render(values))
+        return "\n".join(lines) + "\n"
+
+    def _share_loop(self, interval: float):
+        while True:
+            try:
+                self._write_snapshot()
+            except OSError as e:
+                logging.warning(f"Writing metrics to {self._directory} failed: {e}")
+            time.sleep(interval)
+
+    def _write_snapshot(self):
+        snapshot = {
+            metric.name: [[key, value] for key, value in metric.snapshot().items()]
+            for metric in self._metrics
+        }
+        # Written whole and renamed, so readers never see a partial file
+        path = self._directory / f"{os.getpid()}.json"
+        temporary_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        temporary_path.write_text(json.dumps(snapshot), encoding="UTF-8")
+        os.replace(temporary_path, path)
+
+    def _read_snapshots(self) -> list[list[dict]]:
+        snapshots = []
+        for path in self._directory.glob("*.json"):
+            try:
+                data = json.loads(path.read_text(encoding="UTF-8"))
+            except (OSError, ValueError) as e:
+                logging.warning(f"Skipping unreadable metrics file {path}: {e}")
+                continue
+            snapshots.append(
+                [
+                    {
+                        tuple(tuple(label) for label in key): value
+                        for key, value in data.get(metric.name, ())
+                    }
+                    for metric in self._metrics
+                ]
+            )
+        return snapshots
+
+
+class SamplingFilter(logging.Filter):
+    """Passes only a random share of the records below warning level."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+def _format_labels(key: tuple) -> str:
+    if not key:
+        return ""
+    labels = ",".join(f'{name}="{_escape(value)}"' for name, value in key)
+    return "{" + labels + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REGISTRY = MetricsRegistry()
+
+MODEL_LATENCY = REGISTRY.histogram(
+    "gtp_model_latency_seconds", "Time until the model response is complete."
+)
+MODEL_FIRST_TOKEN = REGISTRY.histogram(
+    "gtp_model_first_token_seconds",
+    "Time until the first chunk of a streamed response.",
+)
+MODEL_TOKENS = REGISTRY.counter(
+    "gtp_model_tokens_total",
+    "Response tokens, streamed chunks or estimated for complete responses.",
+)
+MODEL_ERRORS = REGISTRY.counter("gtp_model_errors_total", "Failed model queries.")
+MODEL_RETRIES = REGISTRY.counter(
+    "gtp_model_retries_total", "Retried model requests, by host and reason."
+)
+CIRCUIT_OPENED = REGISTRY.counter(
+    "gtp_circuit_opened_total", "Times a backend was cut off after repeated failures."
+)
+QUERIES = REGISTRY.counter("gtp_queries_total", "Player queries per level.")
+QUERY_ERRORS = REGISTRY.counter(
+    "gtp_query_errors_total", "Player queries that failed with an error."
+)
+GUARD_LATENCY = REGISTRY.histogram(
+    "gtp_guard_check_seconds",
+    "Time spent in the level's query and response checks.",
+    FAST_BUCKETS,
+)
+INPUT_REJECTIONS = REGISTRY.counter(
+    "gtp_input_rejections_total",
+    "Queries rejected before the model call, by level and check.",
+)
+PROMPT_LATENCY = REGISTRY.histogram(
+    "gtp_prompt_assembly_seconds",
+    "Time spent building the prompt with history.",
+    FAST_BUCKETS,
+)
+PROMPT_TOKENS = REGISTRY.histogram(
+    "gtp_prompt_tokens",
+    "Tokens in the per-turn prompt, excluding the system prompt.",
+    (64, 128, 256, 512, 1024, 2048, 4096),
+)
+RATE_LIMITED = REGISTRY.counter(
+    "gtp_rate_limited_total", "Queries refused because the player sent too many."
+)
+SCHEDULER_WAIT = REGISTRY.histogram(
+    "gtp_scheduler_wait_seconds", "Time queries waited for a free model slot."
+)
+SCHEDULER_REJECTIONS = REGISTRY.counter(
+    "gtp_scheduler_rejections_total",
+    "Queries refused because the model queue was full.",
+)
+EVENTS_DROPPED = REGISTRY.counter(
+    "gtp_events_dropped_total", "Game events dropped because the writer fell behind."
+)
+EVENT_BATCH_LATENCY = REGISTRY.histogram(
+    "gtp_event_batch_seconds", "Time spent writing a batch of game events."
+)
+JUDGE_LATENCY = REGISTRY.histogram(
+    "gtp_judge_seconds", "Time the judge model took to give a verdict."
+)
+JUDGE_VERDICTS = REGISTRY.counter(
+    "gtp_judge_verdicts_total", "Judge verdicts on responses, by verdict and source."
+)
+SPECULATIONS = REGISTRY.counter(
+    "gtp_speculations_total",
+    "Speculative queries by outcome: a safe candidate, all rejected or all failed.",
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "gtp_cache_requests_total", "Response cache lookups by backend, level and result."
+)
+SEMANTIC_CACHE_REQUESTS = REGISTRY.counter(
+    "gtp_semantic_cache_requests_total", "Semantic cache lookups by level and result."
+)
+SEMANTIC_CACHE_LATENCY = REGISTRY.histogram(
+    "gtp_semantic_cache_lookup_seconds",
+    "Time to embed a query and search the level's index.",
+)
+
+# Prompts and responses are large, only log a sample of them
+content_logger = logging.getLogger("game.content")
+content_log_filter = SamplingFilter(float(os.getenv("GTP_LOG_SAMPLE_RATE", "0.1")))
+content_logger.addFilter(content_log_filter)
@@ -1,66 +1,244 @@
 import json
 import logging
+import time
 from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from typing import Literal
 
 import requests
-from pydantic import BaseModel
+
+from game.client import ClientConfig, HTTPClient, ModelError
+from game.metrics import (MODEL_ERRORS, MODEL_FIRST_TOKEN, MODEL_LATENCY,
+                          MODEL_TOKENS, content_logger)
+from game.prompt_builder import HeuristicTokenizer
+
+# Complete responses carry no token count, so theirs is estimated
+_RESPONSE_TOKENIZER = HeuristicTokenizer()
 
 
 class ModelInterface(ABC):
     """Defines interface to communicate with LLM models."""
 
     @abstractmethod
-    def query(self, query: str) -> str:
-        """Query model and return response."""
+    def query(
+        self,
+        query: str,
+        system: str | None = None,
+        options: dict | None = None,
+        history: list[dict] | None = None,
+    ) -> str:
+        """Query model and return response.
+
+        The system prompt and the history of earlier turns are sent as
+        separate messages before the query, so they stay an identical prefix
+        across turns that the server can reuse. History messages have a role,
+        user or assistant, and content. Options are sampling parameters like
+        temperature and seed, for backends that support them.
+        """
+
+    def stream(
+        self,
+        query: str,
+        system: str | None = None,
+        options: dict | None = None,
+        history: list[dict] | None = None,
+    ) -> Iterator[str]:
+        """Query model and yield the response in chunks as they are generated.
+
+        Closing the generator early stops reading the response, which ends the
+        generation for backends that notice the dropped connection.
+        """
+        yield self.query(query, system, options, history)
 
     @abstractmethod
     def get_info(self) -> str:
         """JSON with model info"""
 
+    def is_healthy(self) -> bool:
+        """Return whether the model server can currently take queries."""
+        return True
+
+    def warmup(self) -> bool:
+        """Prepare the backend for the first query, return whether it is ready."""
+        return self.is_healthy()
+
+
+class InstrumentedModelInterface(ModelInterface):
+    """Records latency, time to first token, tokens and errors of a backend.
+
+    Streamed responses count one token per chunk, which is one per token for
+    Ollama, the tokens of complete responses are estimated.
+    """
+
+    def __init__(self, model: ModelInterface, backend: str):
+        self.model = model
+        self.backend = backend
+
+    def query(
+        self,
+        query: str,
+        system: str | None = None,
+        options: dict | None = None,
+        history: list[dict] | None = None,
+    ) -> str:
+        start = time.perf_counter()
+        try:
+            response = self.model.query(query, system, options, history)
+        except Exception:
+            MODEL_ERRORS.inc(backend=self.backend)
+            raise
+        MODEL_LATENCY.observe(time.perf_counter() - start, backend=self.backend)
+        MODEL_TOKENS.inc(_RESPONSE_TOKENIZER.count(response), backend=self.backend)
+        return response
+
+    def stream(
+        self,
+        query: str,
+        system: str | None = None,
+        options: dict | None = None,
+        history: list[dict] | None = None,
+    ) -> Iterator[str]:
+        start = time.perf_counter()
+        tokens = 0
+        try:
+            for chunk in self.model.stream(query, system, options, history):
+                if tokens == 0:
+                    MODEL_FIRST_TOKEN.observe(
+                        time.perf_counter() - start, backend=self.backend
+                    )
+                tokens += 1
+                yield chunk
+        except GeneratorExit:
+            raise
+        except Exception:
+            MODEL_ERRORS.inc(backend=self.backend)
+            raise
+        else:
+            MODEL_LATENCY.observe(time.perf_counter() - start, backend=self.backend)
+        finally:
+            MODEL_TOKENS.inc(tokens, backend=self.backend)
+
+    def get_info(self) -> dict:
+        return self.model.get_info()
+
+    def is_healthy(self) -> bool:
+        return self.model.is_healthy()
+
+    def warmup(self) -> bool:
+        return self.model.warmup()
+
 
-class OllamaInterfaceConfig(BaseModel):
+class OllamaInterfaceConfig(ClientConfig):
     host: str = "http://localhost"
     port: int = 443
     subdomain: str = "/api"
     model: str = "llama3:latest"
+    endpoint: Literal["chat", "generate"] = "chat"
+    keep_alive: str | None = None  # Keep the model loaded, e.g. "30m"
+    preload: bool = False  # Load the model into memory during warm-up
 
 
 class OllamaInterface(ModelInterface):
     def __init__(self, config: OllamaInterfaceConfig):
         self.config = config
         self._model_params = {"model": self.config.model}
+        if self.config.keep_alive is not None:
+            self._model_params["keep_alive"] = self.config.keep_alive
         self._url = f"{self.config.host}:{self.config.port}{self.config.subdomain}"
-        self._check_available_models()
-
-    def query(self, query: str) -> str:
+        # No requests are made here, so workers start without the server being up
+        self._client = HTTPClient(config)
+
+    def query(
+        self,
+        query: str,
+        system: str | None = None,
+        options: dict | None = None,
+        history: list[dict] | None = None,
+    ) -> str:
         """Query a ollama model and get a response."""
-        logging.info(f"Query: {query}")
-        payload = {**self._model_params, "prompt": query}
+        content_logger.info("Query: %s", query)
+        payload = {
+            **self._get_payload(query, system, options, history),
+            "stream": False,
+        }
         headers = {"Content-Type": "application/json"}
-        response = requests.post(
-            self._url + "/generate", data=json.dumps(payload), headers=headers
+        response = self._client.post(
+            self._get_endpoint_url(), data=json.dumps(payload), headers=headers
         )
 
         if response.status_code != 200:
-            raise Exception(
-                f"Request failed with status code {response.status_code}: {response.text}"
-            )
+            raise ModelError.from_response(response)
 
         return self._parse_response(response)
 
+    def stream(
+        self,
+        query: str,
+        system: str | None = None,
+        options: dict | None = None,
+        history: list[dict] | None = None,
+    ) -> Iterator[str]:
+        """Query a ollama model and yield the response as it is generated."""
+        content_logger.info("Query: %s", query)
+        payload = self._get_payload(query, system, options, history)
+        headers = {"Content-Type": "application/json"}
+        with self._client.stream(
+            self._get_endpoint_url(), data=json.dumps(payload), headers=headers
+        ) as response:
+            if response.status_code != 200:
+                raise ModelError.from_response(response)
+
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                partial_response = json.loads(line)
+                yield self._get_partial_text(partial_response)
+                if partial_response["done"]:
+                    break
+
     def get_info(self) -> dict:
-        return self.config.model_dump()
+        return {**self.config.model_dump(), "backend": "ollama"}
+
+    def is_healthy(self) -> bool:
+        try:
+            return self._check_available_models()
+        except requests.RequestException as e:
+            logging.warning(f"Health check for {self._url} failed: {e}")
+            return False
+
+    def warmup(self) -> bool:
+        """Check the model is available and optionally load it into memory."""
+        if not self.is_healthy():
+            return False
+        if not self.config.preload:
+            return True
+        # A request without a prompt only loads the model
+        payload = {
+            "model": self.config.model,
+            "keep_alive": self.config.keep_alive,
+            "stream": False,
+        }
+        try:
+            response = self._client.post(
+                f"{self._url}/generate",
+                data=json.dumps({k: v for k, v in payload.items() if v is not None}),
+                headers={"Content-Type": "application/json"},
+            )
+        except ModelError as e:
+            logging.warning(f"Preloading {self.config.model} failed: {e}")
+            return False
+        return response.status_code == 200
 
-    def _check_available_models(self):
+    def _check_available_models(self) -> bool:
         """Send a request to the API endpoint that returns all available models."""
         headers = {"Content-Type": "application/json"}
-        response = requests.get(f"{self._url}/tags", headers=headers)
+        response = self._client.get(f"{self._url}/tags", headers=headers)
 
         if response.status_code != 200:
             logging.warning(
                 f"Failed to fetch available models with status code {response.status_code}: {response.text}"
             )
-            return
+            return False
 
         available_models = [model["name"] for model in response.json()["models"]]
 
@@ -68,34 +246,110 @@ class OllamaInterface(ModelInterface):
             logging.warning(
                 f"Model '{self.config.model}' is not available on the server. Available models are: {', '.join(available_models)}"
             )
+            return False
+        return True
+
+    def _get_endpoint_url(self) -> str:
+        return f"{self._url}/{self.config.endpoint}"
+
+    def _get_payload(
+        self,
+        query: str,
+        system: str | None,
+        options: dict | None,
+        history: list[dict] | None,
+    ) -> dict:
+        if self.config.endpoint == "generate":
+            # The generate endpoint takes a single prompt, so the turns are joined
+            turns = [f"{m['role']}: {m['content']}" for m in history or ()]
+            payload = {**self._model_params, "prompt": "\n".join(turns + [query])}
+            if system:
+                payload["system"] = system
+            if options:
+                payload["options"] = options
+            return payload
+
+        messages = _get_messages(query, history)
+        if system:
+            messages.insert(0, {"role": "system", "content": system})
+        payload = {**self._model_params, "messages": messages}
+        if options:
+            payload["options"] = options
+        return payload
+
+    def _get_partial_text(self, partial_response: dict) -> str:
+        if self.config.endpoint == "generate":
+            return partial_response["response"]
+        return partial_response["message"]["content"]
 
     def _parse_response(self, response) -> str:
         partial_responses = [json.loads(r) for r in response.text.splitlines()]
         full_response = ""
         for r in partial_responses:
-            full_response += r["response"]
+            full_response += self._get_partial_text(r)
             if r["done"]:
                 break
-        logging.info(f"Response: {full_response}")
+        content_logger.info("Response: %s", full_response)
         return full_response
 
 
-class ChatGPTInterfaceConfig(BaseModel):
+class ChatGPTInterfaceConfig(ClientConfig):
     api_key: str
     model: str = "gpt-4"
     organization: str = None  # Optional: specify if using multiple organizations
     project: str = None  # Optional: specify if using project-scoped keys
+    url: str = "https://api.openai.com/v1/chat/completions"
 
 
 class ChatGPTInterface(ModelInterface):
     def __init__(self, config: ChatGPTInterfaceConfig):
         self.config = config
-        self._url = "https://api.openai.com/v1/chat/completions"
-
-    def query(self, query: str) -> str:
+        self._url = self.config.url
+        self._client = HTTPClient(config)
+
+    def query(
+        self,
+        query: str,
+        system: str | None = None,
+        options: dict | None = None,
+        history: list[dict] | None = None,
+    ) -> str:
         """Query ChatGPT model and get a response."""
-        logging.info(f"Query: {query}")
+        content_logger.info("Query: %s", query)
+
+        response = self._client.post(
+            self._url,
+            headers=self._get_headers(),
+            json=self._get_payload(query, system, options, history),
+        )
+        self._check_status(response)
+        return self._parse_response(response)
 
+    def stream(
+        self,
+        query: str,
+        system: str | None = None,
+        options: dict | None = None,
+        history: list[dict] | None = None,
+    ) -> Iterator[str]:
+        """Query ChatGPT model and yield the response as it is generated."""
+        content_logger.info("Query: %s", query)
+        payload = {**self._get_payload(query, system, options, history), "stream": True}
+        with self._client.stream(
+            self._url, headers=self._get_headers(), json=payload
+        ) as response:
+            self._check_status(response)
+            for data in _iter_sse_data(response):
+                if data == "[DONE]":
+                    break
+                delta = json.loads(data)["choices"][0]["delta"]
+                if delta.get("content"):
+                    yield delta["content"]
+
+    def get_info(self) -> dict:
+        return {**self.config.model_dump(), "backend": "chatgpt"}
+
+    def _get_headers(self) -> dict:
         headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.config.api_key}",
@@ -106,76 +360,131 @@ class ChatGPTInterface(ModelInterface):
             headers["OpenAI-Organization"] = self.config.organization
         if self.config.project:
             headers["OpenAI-Project"] = self.config.project
-
-        payload = {
+        return headers
+
+    def _get_payload(
+        self,
+        query: str,
+        system: str | None,
+        options: dict | None,
+        history: list[dict] | None,
+    ) -> dict:
+        messages = _get_messages(query, history)
+        if system:
+            messages.insert(0, {"role": "system", "content": system})
+        return {
             "model": self.config.model,
-            "messages": [{"role": "user", "content": query}],
+            "messages": messages,
             "temperature": 0.7,  # Optionally customize other parameters
+            **(options or {}),
         }
 
-        response = requests.post(self._url, headers=headers, json=payload)
-
+    def _check_status(self, response):
         if response.status_code == 401:
-            raise Exception(
-                "Authentication failed: Invalid API key or other authentication error."
+            raise ModelError(
+                "Authentication failed: Invalid API key or other authentication error.",
+                status_code=401,
             )
         elif response.status_code != 200:
-            raise Exception(
-                f"Request failed with status code {response.status_code}: {response.text}"
-            )
-
-        return self._parse_response(response)
-
-    def get_info(self) -> dict:
-        return self.config.model_dump()
+            raise ModelError.from_response(response)
 
     def _parse_response(self, response) -> str:
         response_json = response.json()
         full_response = response_json["choices"][0]["message"]["content"]
-        logging.info(f"Response: {full_response}")
+        content_logger.info("Response: %s", full_response)
         return full_response
 
 
-class ClaudeInterfaceConfig(BaseModel):
+class ClaudeInterfaceConfig(ClientConfig):
     api_key: str
     model: str = "claude-3-5-sonnet-20240620"
     version: str = "2023-06-01"
+    url: str = "https://api.anthropic.com/v1/messages"
 
 
 class ClaudeInterface(ModelInterface):
     def __init__(self, config: ClaudeInterfaceConfig):
         self.config = config
-        self._url = "https://api.anthropic.com/v1/messages"
-
-    def query(self, query: str) -> str:
+        self._url = self.config.url
+        self._client = HTTPClient(config)
+
+    def query(
+        self,
+        query: str,
+        system: str | None = None,
+        options: dict | None = None,
+        history: list[dict] | None = None,
+    ) -> str:
         """Query Claude model and get a response."""
-        logging.info(f"Query: {query}")
+        content_logger.info("Query: %s", query)
 
-        headers = {
+        response = self._client.post(
+            self._url,
+            headers=self._get_headers(),
+            json=self._get_payload(query, system, options, history),
+        )
+
+        if response.status_code != 200:
+            raise ModelError.from_response(response)
+
+        return self._parse_response(response)
+
+    def stream(
+        self,
+        query: str,
+        system: str | None = None,
+        options: dict | None = None,
+        history: list[dict] | None = None,
+    ) -> Iterator[str]:
+        """Query Claude model and yield the response as it is generated."""
+        content_logger.info("Query: %s", query)
+        payload = {**self._get_payload(query, system, options, history), "stream": True}
+        with self._client.stream(
+            self._url, headers=self._get_headers(), json=payload
+        ) as response:
+            if response.status_code != 200:
+                raise ModelError.from_response(response)
+
+            for data in _iter_sse_data(response):
+                event = json.loads(data)
+                if event["type"] == "content_block_delta":
+                    if event["delta"]["type"] == "text_delta":
+                        yield event["delta"]["text"]
+                elif event["type"] == "message_stop":
+                    break
+                elif event["type"] == "error":
+                    raise ModelError(f"Stream failed: {event['error']}")
+
+    def get_info(self) -> dict:
+        return {**self.config.model_dump(), "backend": "claude"}
+
+    def _get_headers(self) -> dict:
+        return {
             "Content-Type": "application/json",
             "x-api-key": self.config.api_key,
             "anthropic-version": self.config.version,
         }
 
-        messages = [{"role": "user", "content": query}]
+    def _get_payload(
+        self,
+        query: str,
+        system: str | None,
+        options: dict | None,
+        history: list[dict] | None,
+    ) -> dict:
+        messages = _get_messages(query, history)
 
         payload = {
             "model": self.config.model,
             "messages": messages,
             "max_tokens": 2000,
         }
-
-        response = requests.post(self._url, headers=headers, json=payload)
-
-        if response.status_code != 200:
-            raise Exception(
-                f"Request failed with status code {response.status_code}: {response.text}"
-            )
-
-        return self._parse_response(response)
-
-    def get_info(self) -> dict:
-        return self.config.model_dump()
+        if system:
+            payload["system"] = system
+        if options:
+            # The messages API has no seed, requests with one would be rejected
+            payload.update({k: v for k, v in options.items() if k != "seed"})
+        return payload
 
     def _parse_response(self, response) -> str:
         response_json = response.json()
@@ -184,7 +493,7 @@ class ClaudeInterface(ModelInterface):
             logging.error(
                 f"Expected 'content' key not found in response: {response_json}"
             )
-            raise Exception("Invalid API response format")
+            raise ModelError("Invalid API response format")
 
         full_response = "".join(
             [
@@ -194,5 +503,16 @@ class ClaudeInterface(ModelInterface):
             ]
         )
 
-        logging.info(f"Response: {full_response}")
+        content_logger.info("Response: %s", full_response)
         return full_response
+
+
+def _get_messages(query: str, history: list[dict] | None) -> list[dict]:
+    return [*(history or ()), {"role": "user", "content": query}]
+
+
+def _iter_sse_data(response) -> Iterator[str]:
+    """Yield the data field of every server-sent event in a streamed response."""
+    for line in response.iter_lines(decode_unicode=True):
+        if line and line.startswith("data:"):
+            yield line.removeprefix("data:").strip()
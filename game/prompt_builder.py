@@ -0,0 +1,137 @@
+import logging
+import re
+from abc import ABC, abstractmethod
+from functools import lru_cache
+
+from pydantic import BaseModel
+
+# Rough stand-in for BPE tokenizers, which average about four characters per token
+_TOKEN_PATTERN = re.compile(r"\w{1,4}|[^\w\s]")
+# Chat message roles of the conversation's users, where they differ
+_ROLES = {"model": "assistant"}
+
+
+class PromptConfig(BaseModel):
+    history_token_budget: int = 1500
+    query_token_budget: int = 500
+
+
+class Tokenizer(ABC):
+    @abstractmethod
+    def count(self, text: str) -> int:
+        """Return the number of tokens in text."""
+
+    @abstractmethod
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Return the start of text that fits in max_tokens."""
+
+
+class HeuristicTokenizer(Tokenizer):
+    """Approximate token counts for backends without a local tokenizer."""
+
+    def count(self, text: str) -> int:
+        return len(_TOKEN_PATTERN.findall(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        for i, match in enumerate(_TOKEN_PATTERN.finditer(text)):
+            if i == max_tokens:
+                return text[: match.start()]
+        return text
+
+
+class TiktokenTokenizer(Tokenizer):
+    def __init__(self, model: str):
+        import tiktoken
+
+        try:
+            self._encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            self._encoding = tiktoken.get_encoding("cl100k_base")
+
+    def count(self, text: str) -> int:
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        tokens = self._encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return self._encoding.decode(tokens[:max_tokens])
+
+
+@lru_cache
+def get_tokenizer(model_type: str, model: str) -> Tokenizer:
+    """Return the tokenizer for a backend, loading it on first use."""
+    if model_type == "chatgpt":
+        try:
+            return TiktokenTokenizer(model)
+        except ImportError:
+            logging.info("tiktoken is not installed, estimating token counts")
+    return HeuristicTokenizer()
+
+
+class PromptBuilder:
+    """Assembles the per-turn prompt within a token budget.
+
+    History is added newest first until the history budget is spent, and
+    overly long queries are cut to the query budget, so prompt size stays
+    bounded whatever players paste in. Earlier turns are returned as chat
+    messages, so they stay the same from turn to turn and the model server
+    can reuse its cache of them.
+    """
+
+    def __init__(self, model_type: str, model: str, config: PromptConfig):
+        self.model_type = model_type
+        self.model = model
+        self.config = config
+
+    @property
+    def tokenizer(self) -> Tokenizer:
+        return get_tokenizer(self.model_type, self.model)
+
+    def build(
+        self,
+        repeated_prompt: str,
+        conversation,
+        query: str,
+        repeated_tokens: int | None = None,
+    ) -> tuple[str, list[dict], int]:
+        """Return the prompt for this turn, the history messages and the token count.
+
+        The repeated prompt is put before the query, so earlier turns don't
+        contain it. Pass its token count if it is known already.
+        """
+        query_tokens = self.tokenizer.count(query)
+        if query_tokens > self.config.query_token_budget:
+            query = self.tokenizer.truncate(query, self.config.query_token_budget)
+            query_tokens = self.config.query_token_budget
+
+        history, history_tokens, _ = self.get_history(conversation)
+        prompt = f"{repeated_prompt}\n{query}" if repeated_prompt else query
+        if repeated_tokens is None:
+            repeated_tokens = self.tokenizer.count(repeated_prompt)
+        tokens = repeated_tokens + history_tokens + query_tokens
+        return prompt, history, tokens
+
+    def get_history(self, conversation) -> tuple[list[dict], int, int]:
+        """Return the history messages, their token count and number of messages.
+
+        The result is cached on the conversation until a message is added.
+        """
+        if conversation.rendered_history is None:
+            messages = []
+            tokens = 0
+            for message in reversed(conversation.history):
+                if message.tokens is None:
+                    message.tokens = self.tokenizer.count(message.message)
+                if tokens + message.tokens > self.config.history_token_budget:
+                    break
+                tokens += message.tokens
+                role = _ROLES.get(message.user.value, message.user.value)
+                messages.append({"role": role, "content": message.message})
+            if messages and messages[-1]["role"] != "user":
+                # Chat APIs expect the turns to start with the user
+                tokens -= conversation.history[-len(messages)].tokens
+                messages.pop()
+            messages.reverse()
+            conversation.rendered_history = (messages, tokens, len(messages))
+        return conversation.rendered_history
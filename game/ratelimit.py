@@ -0,0 +1,59 @@
+import threading
+import time
+from typing import Literal
+
+from pydantic import BaseModel
+
+from game.storage import KeyValueStore, create_store
+
+
+class RateLimitConfig(BaseModel):
+    rate: float = 0.5  # Queries per second a player regains
+    burst: int = 10  # Queries a player can send at once
+    key: Literal["session", "ip"] = "session"
+    store: str = "memory"
+    max_players: int = 100000
+
+
+class TokenBucketLimiter:
+    """Allows every key burst queries at once and rate queries per second after that.
+
+    Buckets are stored as 'tokens:timestamp' strings, so a SQLite store can
+    share them between the workers on a host. Updates from different workers
+    are not atomic, which may let a few extra queries through under contention.
+    """
+
+    def __init__(
+        self, store: KeyValueStore, rate: float, burst: int, key: str = "session"
+    ):
+        self.store = store
+        self.rate = rate
+        self.burst = burst
+        self.key = key  # What the web app identifies players by
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str) -> float:
+        """Take a token for key, return 0 if allowed or else the seconds to wait."""
+        with self._lock:
+            now = time.time()
+            tokens = float(self.burst)
+            data = self.store.get(key)
+            if data is not None:
+                stored_tokens, updated = data.split(":")
+                tokens = min(
+                    self.burst,
+                    float(stored_tokens) + (now - float(updated)) * self.rate,
+                )
+            if tokens >= 1:
+                self.store.set(key, f"{tokens - 1}:{now}")
+                return 0.0
+            self.store.set(key, f"{tokens}:{now}")
+            return (1 - tokens) / self.rate
+
+
+def create_limiter(config: RateLimitConfig) -> TokenBucketLimiter:
+    # A bucket that expired has refilled completely
+    store = create_store(
+        config.store, max_size=config.max_players, ttl=config.burst / config.rate
+    )
+    return TokenBucketLimiter(store, config.rate, config.burst, config.key)
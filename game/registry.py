@@ -0,0 +1,103 @@
+import importlib
+import json
+from functools import lru_cache
+from pathlib import Path
+from typing import Literal
+
+from pydantic import BaseModel, ConfigDict, model_validator
+
+from game import prompts
+from game.guard import Guard
+from game.levels.declarative import DeclarativeLevel
+
+# Named prompts that system prompt templates can use, e.g. "{setting} ..."
+PROMPT_TEMPLATES = {
+    "setting": prompts._setting,
+    "no_guard": prompts.no_guard,
+    "simple_guard": prompts.simple_guard,
+    "extended_guard": prompts.extended_guard,
+}
+
+
+class LevelSpec(BaseModel):
+    """Declarative definition of a level.
+
+    Either guard names a Guard subclass, e.g. 'game.levels.my_level.MyLevel',
+    that is created with the password, or the other fields describe the level.
+    """
+
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
+    password: str
+    guard: str | None = None
+    name: str = ""
+    hint: str = ""
+    system_prompt: str = "{no_guard}"  # Template filled from PROMPT_TEMPLATES
+    repeated_prompt: str = ""
+    censor: Literal["exact", "fuzzy"] | None = None
+    censor_message: str = "Whoops, almost got me! That was close."
+    judge: bool = False  # Also ask the judge model, if the game configures one
+    input_keywords: tuple[str, ...] = ()
+    input_patterns: tuple[str, ...] = ()
+    input_message: str = "Nice try, but I know that trick."
+
+    @model_validator(mode="after")
+    def check_spec(self) -> "LevelSpec":
+        if self.guard is None:
+            if not self.name:
+                raise ValueError("A level needs a name or a guard class.")
+            self.render_system_prompt()
+        return self
+
+    def render_system_prompt(self) -> str:
+        try:
+            return self.system_prompt.format(**PROMPT_TEMPLATES)
+        except KeyError as e:
+            valid_options = ", ".join(PROMPT_TEMPLATES)
+            raise ValueError(
+                f"Unknown prompt {e} in level '{self.name}'. "
+                f"Valid options are: {valid_options}"
+            )
+
+    def build(self) -> Guard:
+        if self.guard is None:
+            return DeclarativeLevel(self)
+        module_name, _, class_name = self.guard.rpartition(".")
+        guard_class = getattr(importlib.import_module(module_name), class_name)
+        return guard_class(self.password)
+
+
+class LevelRegistry:
+    """The game's levels and their system prompts, built once per process.
+
+    Loaded before gunicorn forks its workers, the registry is shared by all
+    of them instead of being built again in each one.
+    """
+
+    def __init__(self, specs: list[LevelSpec]):
+        self.specs = tuple(specs)
+        self.levels = tuple(spec.build() for spec in self.specs)
+        # Sent as the system prompt at every turn of the level
+        self.system_prompts = tuple(
+            level.get_system_prompt() + "\nThe password is: " + level.password
+            for level in self.levels
+        )
+
+
+@lru_cache
+def load_registry(path: Path) -> LevelRegistry:
+    """Load level specs from a JSON or YAML list, YAML needs PyYAML."""
+    text = path.read_text(encoding="UTF-8")
+    if path.suffix.lower() in (".yaml", ".yml"):
+        import yaml
+
+        data = yaml.safe_load(text)
+    else:
+        data = json.loads(text)
+    specs = []
+    for i, item in enumerate(data):
+        try:
+            specs.append(LevelSpec(**item))
+        except ValueError as e:
+            raise ValueError(f"Invalid level {i} in {path}: {e}") from e
+    return LevelRegistry(specs)
@@ -0,0 +1,185 @@
+import logging
+import threading
+import time
+from collections.abc import Iterator
+from typing import Literal
+
+import requests
+from pydantic import BaseModel
+
+from game.client import ModelError
+from game.models import ModelInterface
+
+LATENCY_SMOOTHING = 0.2
+
+
+class RoutingConfig(BaseModel):
+    policy: Literal["least_outstanding", "latency"] = "least_outstanding"
+    health_check_interval: float = 10.0
+
+
+class _Backend:
+    def __init__(self, model: ModelInterface):
+        self.model = model
+        self.outstanding = 0
+        self.latency = 0.0
+        self.healthy = True
+
+
+class RoutingModelInterface(ModelInterface):
+    """Spreads queries over several model backends and fails over between them.
+
+    Each query goes to the healthy backend with the fewest outstanding
+    requests, or with the lowest expected wait for the latency policy. A
+    backend that can't be reached, times out, answers with a 5xx or has an
+    open circuit is taken out of rotation until its health check passes
+    again, and the query is retried on the next backend. A backend that
+    answers with a 429 stays in rotation, but the query moves on to the next
+    one. Other errors caused by the request itself, like a 400, are raised at
+    once, because every backend would reject it the same way.
+    """
+
+    def __init__(self, models: list[ModelInterface], config: RoutingConfig):
+        if not models:
+            raise ValueError("At least one backend is required for routing.")
+        self.config = config
+        self._backends = [_Backend(model) for model in models]
+        self._lock = threading.Lock()
+        threading.Thread(target=self._health_check_loop, daemon=True).start()
+
+    def query(
+        self,
+        query: str,
+        system: str | None = None,
+        options: dict | None = None,
+        history: list[dict] | None = None,
+    ) -> str:
+        error = None
+        for backend in self._get_candidates():
+            start = self._start(backend)
+            try:
+                response = backend.model.query(query, system, options, history)
+            except Exception as e:
+                if not self._fail(backend, e):
+                    raise
+                error = e
+                continue
+            self._finish(backend, start)
+            return response
+        raise error
+
+    def stream(
+        self,
+        query: str,
+        system: str | None = None,
+        options: dict | None = None,
+        history: list[dict] | None = None,
+    ) -> Iterator[str]:
+        error = None
+        for backend in self._get_candidates():
+            start = self._start(backend)
+            started = False
+            try:
+                for chunk in backend.model.stream(query, system, options, history):
+                    started = True
+                    yield chunk
+            except GeneratorExit:
+                self._finish(backend, start)
+                raise
+            except Exception as e:
+                if not self._fail(backend, e) or started:
+                    # Part of the response already reached the caller, can't retry
+                    raise
+                error = e
+                continue
+            self._finish(backend, start)
+            return
+        raise error
+
+    def get_info(self) -> dict:
+        return {**self._backends[0].model.get_info(), "backends": len(self._backends)}
+
+    def is_healthy(self) -> bool:
+        return any(backend.healthy for backend in self._backends)
+
+    def warmup(self) -> bool:
+        """Warm up every backend at once, ready as soon as all of them answered."""
+        threads = [
+            threading.Thread(target=self._warmup_backend, args=(backend,))
+            for backend in self._backends
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.is_healthy()
+
+    def _get_candidates(self) -> list[_Backend]:
+        """Return backends in the order they should be tried for the next query."""
+        with self._lock:
+            healthy = [b for b in self._backends if b.healthy]
+            unhealthy = [b for b in self._backends if not b.healthy]
+        if self.config.policy == "latency":
+            healthy.sort(key=lambda b: (b.outstanding + 1) * b.latency)
+        else:
+            healthy.sort(key=lambda b: b.outstanding)
+        # Unhealthy backends are a last resort, the check may be out of date
+        return healthy + unhealthy
+
+    def _start(self, backend: _Backend) -> float:
+        with self._lock:
+            backend.outstanding += 1
+        return time.monotonic()
+
+    def _finish(self, backend: _Backend, start: float):
+        latency = time.monotonic() - start
+        with self._lock:
+            backend.outstanding -= 1
+            backend.healthy = True
+            backend.latency += LATENCY_SMOOTHING * (latency - backend.latency)
+
+    def _fail(self, backend: _Backend, error: Exception) -> bool:
+        """Release the backend after an error, return whether to try the next one."""
+        failed = _is_backend_failure(error)
+        if failed:
+            logging.warning(
+                f"Backend {backend.model.get_info().get('host')} failed: {error}"
+            )
+        with self._lock:
+            backend.outstanding -= 1
+            if failed:
+                backend.healthy = False
+        return failed or _is_rate_limited(error)
+
+    def _warmup_backend(self, backend: _Backend):
+        healthy = backend.model.warmup()
+        with self._lock:
+            backend.healthy = healthy
+
+    def _health_check_loop(self):
+        while True:
+            time.sleep(self.config.health_check_interval)
+            for backend in self._backends:
+                try:
+                    healthy = backend.model.is_healthy()
+                except Exception as e:
+                    # A malformed answer must not stop the checks for good
+                    logging.warning(
+                        f"Health check of {backend.model.get_info().get('host')} "
+                        f"failed: {e}"
+                    )
+                    healthy = False
+                with self._lock:
+                    backend.healthy = healthy
+
+
+def _is_backend_failure(error: Exception) -> bool:
+    if isinstance(error, ModelError):
+        return error.backend_failed
+    # Reading a streamed body can still fail on the connection
+    return isinstance(error, requests.RequestException)
+
+
+def _is_rate_limited(error: Exception) -> bool:
+    """Whether the backend is busy, another one may still have capacity."""
+    return isinstance(error, ModelError) and error.status_code == 429
@@ -0,0 +1,83 @@
+from abc import ABC, abstractmethod
+
+
+class ResponseScanner(ABC):
+    """Checks a model response incrementally while it is being streamed."""
+
+    blocked: bool = False
+
+    @abstractmethod
+    def feed(self, chunk: str) -> str:
+        """Consume the next chunk and return the text that is safe to show so far."""
+
+    @abstractmethod
+    def flush(self) -> str:
+        """Return any text that was held back, once the response is complete."""
+
+
+class PassthroughScanner(ResponseScanner):
+    """Lets every chunk through, the full response is only checked at the end."""
+
+    def feed(self, chunk: str) -> str:
+        return chunk
+
+    def flush(self) -> str:
+        return ""
+
+
+class SubstringScanner(ResponseScanner):
+    """Blocks a response containing a phrase, even when it is split over chunks.
+
+    The last len(phrase) - 1 characters are held back until more text arrives,
+    so every chunk is only searched together with that short tail.
+    """
+
+    def __init__(self, phrase: str):
+        self._phrase = phrase.upper()
+        self._holdback = len(phrase) - 1
+        self._pending = ""
+        self.blocked = False
+
+    def feed(self, chunk: str) -> str:
+        if self.blocked:
+            return ""
+        self._pending += chunk
+        if self._phrase in self._pending.upper():
+            self.blocked = True
+            self._pending = ""
+            return ""
+        split = max(len(self._pending) - self._holdback, 0)
+        safe, self._pending = self._pending[:split], self._pending[split:]
+        return safe
+
+    def flush(self) -> str:
+        if self.blocked:
+            return ""
+        safe, self._pending = self._pending, ""
+        return safe
+
+
+class BufferedScanner(ResponseScanner):
+    """Holds the whole response back until it is complete.
+
+    For checks that need the full response, like the judge, text may only be
+    shown once they passed. The wrapped scanner still blocks leaks as they
+    arrive, so the generation is stopped early.
+    """
+
+    def __init__(self, scanner: ResponseScanner):
+        self._scanner = scanner
+        self._held = []
+
+    @property
+    def blocked(self) -> bool:
+        return self._scanner.blocked
+
+    def feed(self, chunk: str) -> str:
+        self._held.append(self._scanner.feed(chunk))
+        return ""
+
+    def flush(self) -> str:
+        if self.blocked:
+            return ""
+        return "".join(self._held) + self._scanner.flush()
@@ -0,0 +1,119 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from pydantic import BaseModel
+
+from game.metrics import SCHEDULER_REJECTIONS, SCHEDULER_WAIT
+
+
+class SchedulerConfig(BaseModel):
+    max_concurrent: int = 8  # Model calls running at once
+    max_queued: int = 256
+    max_queued_per_player: int = 2
+    queue_timeout: float = 30.0
+
+
+class ModelBusyError(Exception):
+    """Raised when a query can't be queued for the model, or waited too long."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"The model is busy, retry after {retry_after:.0f}s.")
+        self.retry_after = retry_after
+
+
+class FairScheduler:
+    """Shares a fixed number of model slots fairly between players.
+
+    When every slot is taken, queries wait in a queue per player. A freed slot
+    goes to the next player in round robin order, so every waiting player
+    gets an equal share of the model, however many queries they send. Queues
+    are bounded, and a query that doesn't fit is rejected right away.
+    """
+
+    def __init__(self, config: SchedulerConfig):
+        self.config = config
+        self._active = 0
+        self._queued = 0
+        self._queues: OrderedDict[str, deque[threading.Event]] = OrderedDict()
+        self._slot_time = 1.0  # Moving average of how long a slot is held
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self, player: str | None) -> Iterator[None]:
+        """Hold a model slot for the duration of the block."""
+        self.acquire(player or "")
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+    def acquire(self, player: str):
+        start = time.monotonic()
+        with self._lock:
+            if self._active < self.config.max_concurrent and not self._queued:
+                self._active += 1
+                return
+            queue = self._queues.get(player, ())
+            if (
+                self._queued >= self.config.max_queued
+                or len(queue) >= self.config.max_queued_per_player
+            ):
+                SCHEDULER_REJECTIONS.inc()
+                raise ModelBusyError(self._retry_after())
+            waiter = threading.Event()
+            self._queues.setdefault(player, deque()).append(waiter)
+            self._queued += 1
+
+        if not waiter.wait(self.config.queue_timeout):
+            with self._lock:
+                # The slot may have been handed over just after the timeout
+                if not waiter.is_set():
+                    self._remove(player, waiter)
+                    SCHEDULER_REJECTIONS.inc()
+                    raise ModelBusyError(self._retry_after())
+        SCHEDULER_WAIT.observe(time.monotonic() - start)
+
+    def try_acquire(self) -> bool:
+        """Take a slot only if one is free and nobody is waiting for it."""
+        with self._lock:
+            if self._active < self.config.max_concurrent and not self._queued:
+                self._active += 1
+                return True
+            return False
+
+    def release(self, held: float | None = None):
+        """Free a slot, held is how long it was used for the Retry-After estimate.
+
+        Slots taken with try_acquire alongside a held one are released without
+        it, so they don't count as extra, instant model calls.
+        """
+        with self._lock:
+            if held is not None:
+                self._slot_time = 0.9 * self._slot_time + 0.1 * held
+            if not self._queues:
+                self._active -= 1
+                return
+            # Hand the slot to the player that has waited longest for a turn
+            player, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            self._queued -= 1
+            if queue:
+                self._queues.move_to_end(player)
+            else:
+                del self._queues[player]
+            waiter.set()
+
+    def _remove(self, player: str, waiter: threading.Event):
+        queue = self._queues[player]
+        queue.remove(waiter)
+        self._queued -= 1
+        if not queue:
+            del self._queues[player]
+
+    def _retry_after(self) -> float:
+        """Estimate when a slot frees up for a new query."""
+        return self._slot_time * (self._queued / self.config.max_concurrent + 1)
@@ -0,0 +1,160 @@
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from pydantic import BaseModel
+
+from game.client import ClientConfig, HTTPClient, ModelError
+from game.metrics import SEMANTIC_CACHE_LATENCY, SEMANTIC_CACHE_REQUESTS
+
+
+class OllamaEmbedderConfig(ClientConfig):
+    host: str = "http://localhost"
+    port: int = 11434
+    subdomain: str = "/api"
+    model: str = "nomic-embed-text"
+    # A lookup only saves time if it's fast, a slow one is given up on
+    connect_timeout: float = 1.0
+    read_timeout: float = 2.0
+    max_retries: int = 0
+
+
+class SemanticCacheConfig(BaseModel):
+    model: OllamaEmbedderConfig = OllamaEmbedderConfig()
+    threshold: float = 0.92  # Cosine similarity at which queries count as the same
+    max_size: int = 5000  # Entries per level
+
+
+class Embedder(ABC):
+    @abstractmethod
+    def embed(self, text: str) -> list[float]:
+        """Return a vector for text, similar texts get similar vectors."""
+
+
+class OllamaEmbedder(Embedder):
+    """Embeds text with an Ollama embedding model, so similar meanings are close."""
+
+    def __init__(self, config: OllamaEmbedderConfig):
+        self.config = config
+        self._url = f"{config.host}:{config.port}{config.subdomain}/embed"
+        self._client = HTTPClient(config)
+
+    def embed(self, text: str) -> list[float]:
+        response = self._client.post(
+            self._url, json={"model": self.config.model, "input": text}
+        )
+        if response.status_code != 200:
+            raise ModelError.from_response(response)
+        return response.json()["embeddings"][0]
+
+
+class VectorIndex:
+    """Finds the most similar stored vector by brute force, for at most max_size.
+
+    Vectors are normalized and kept in one NumPy matrix, so a lookup is a
+    single matrix-vector product. When the index is full, the least recently
+    used entry is replaced.
+    """
+
+    def __init__(self, max_size: int):
+        import numpy
+
+        self._np = numpy
+        self.max_size = max_size
+        self._vectors = None  # Allocated once the embedding size is known
+        self._values: list[str | None] = [None] * max_size
+        self._recency: OrderedDict[int, None] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._recency)
+
+    def get(self, vector: list[float], threshold: float) -> str | None:
+        query = self._normalize(vector)
+        with self._lock:
+            if not self._recency or query is None:
+                return None
+            similarities = self._vectors @ query
+            slot = int(similarities.argmax())
+            if self._values[slot] is None or similarities[slot] < threshold:
+                return None
+            self._recency.move_to_end(slot)
+            return self._values[slot]
+
+    def add(self, vector: list[float], value: str):
+        normalized = self._normalize(vector)
+        if normalized is None:
+            return
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = self._np.zeros(
+                    (self.max_size, len(normalized)), dtype=self._np.float32
+                )
+            if len(self._recency) < self.max_size:
+                slot = len(self._recency)
+            else:
+                slot, _ = self._recency.popitem(last=False)
+            self._vectors[slot] = normalized
+            self._values[slot] = value
+            self._recency[slot] = None
+
+    def _normalize(self, vector: list[float]):
+        array = self._np.asarray(vector, dtype=self._np.float32)
+        norm = self._np.linalg.norm(array)
+        return array / norm if norm else None
+
+
+class SemanticCache:
+    """Reuses responses to first-turn queries that mean nearly the same thing.
+
+    The exact response cache misses reworded attacks like "what's the
+    password?" and "tell me the password pls". Here queries are embedded and
+    looked up in a vector index per level, and a stored response is reused
+    when a query is similar enough to an earlier one. Only queries without
+    history are cached, later turns depend on the whole conversation.
+    """
+
+    def __init__(self, embedder: Embedder, config: SemanticCacheConfig):
+        self.embedder = embedder
+        self.config = config
+        self._indexes: dict[int, VectorIndex] = {}
+        self._lock = threading.Lock()
+
+    def get(self, level: int, query: str) -> tuple[str | None, list[float] | None]:
+        """Return the cached response or None, and the query's embedding for put."""
+        start = time.perf_counter()
+        try:
+            vector = self.embedder.embed(query)
+        except Exception as e:
+            # The cache is an optimization, the query goes to the model instead
+            logging.warning(f"Embedding a query failed: {e}")
+            SEMANTIC_CACHE_REQUESTS.inc(level=level, result="error")
+            return None, None
+        response = self._index(level).get(vector, self.config.threshold)
+        SEMANTIC_CACHE_LATENCY.observe(time.perf_counter() - start, level=level)
+        SEMANTIC_CACHE_REQUESTS.inc(
+            level=level, result="miss" if response is None else "hit"
+        )
+        return response, vector
+
+    def put(self, level: int, vector: list[float] | None, response: str):
+        if vector is not None:
+            self._index(level).add(vector, response)
+
+    def _index(self, level: int) -> VectorIndex:
+        with self._lock:
+            if level not in self._indexes:
+                self._indexes[level] = VectorIndex(self.config.max_size)
+            return self._indexes[level]
+
+
+def create_semantic_cache(config: SemanticCacheConfig) -> SemanticCache | None:
+    """Create the semantic cache, or return None if NumPy is not installed."""
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        logging.warning("numpy is not installed, the semantic cache is disabled")
+        return None
+    return SemanticCache(OllamaEmbedder(config.model), config)
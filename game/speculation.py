@@ -0,0 +1,126 @@
+import random
+import threading
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from pydantic import BaseModel
+
+from game.metrics import SPECULATIONS
+from game.models import ModelInterface
+from game.scanners import ResponseScanner
+
+
+class SpeculationConfig(BaseModel):
+    candidates: int = 3  # Generations per query, when there are free model slots
+    temperatures: list[float] = [0.7, 0.9, 1.0]  # Used by the candidates in turn
+    levels: list[int] | None = None  # Levels to speculate on, all if not set
+    max_workers: int = 64
+
+
+class SpeculativeGenerator:
+    """Generates several responses at once and keeps the first that passes the guard.
+
+    Every candidate is sampled with its own temperature and seed and streamed
+    through the level's scanner, so a candidate that leaks is dropped as soon
+    as the scanner blocks it. The first candidate that also passes the full
+    response check wins, and the streams of the others are closed, which
+    stops their generation. When every candidate is rejected, the first
+    rejection is returned.
+    """
+
+    def __init__(self, model: ModelInterface, config: SpeculationConfig):
+        self.model = model
+        self.config = config
+        self._executor = ThreadPoolExecutor(
+            max_workers=config.max_workers, thread_name_prefix="speculation"
+        )
+
+    def applies(self, level: int) -> bool:
+        return self.config.levels is None or level in self.config.levels
+
+    def generate(
+        self,
+        query: str,
+        system: str | None,
+        history: list[dict],
+        candidates: int,
+        new_scanner: Callable[[], ResponseScanner],
+        check: Callable[[str], tuple[bool, str]],
+    ) -> tuple[str, bool, str]:
+        """Return a response, whether it passed the check, and the response on false."""
+        cancelled = threading.Event()
+        futures = [
+            self._executor.submit(
+                self._candidate,
+                query,
+                system,
+                history,
+                self._get_options(i),
+                new_scanner(),
+                check,
+                cancelled,
+            )
+            for i in range(candidates)
+        ]
+        rejected = None
+        error = None
+        try:
+            for future in as_completed(futures):
+                try:
+                    response, response_ok, response_not_ok_response = future.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                if response_ok:
+                    SPECULATIONS.inc(result="safe")
+                    return response, True, ""
+                if rejected is None:
+                    rejected = (response, False, response_not_ok_response)
+        finally:
+            cancelled.set()
+            for future in futures:
+                future.cancel()
+
+        if rejected is None:
+            SPECULATIONS.inc(result="error")
+            raise error
+        SPECULATIONS.inc(result="rejected")
+        return rejected
+
+    def _candidate(
+        self,
+        query: str,
+        system: str | None,
+        history: list[dict],
+        options: dict,
+        scanner: ResponseScanner,
+        check: Callable[[str], tuple[bool, str]],
+        cancelled: threading.Event,
+    ) -> tuple[str, bool, str]:
+        chunks = []
+        stream = self.model.stream(query, system, options, history)
+        try:
+            for chunk in stream:
+                if cancelled.is_set():
+                    break
+                chunks.append(chunk)
+                scanner.feed(chunk)
+                if scanner.blocked:
+                    break
+        finally:
+            # Stops the generation once another candidate won or this one leaked
+            stream.close()
+
+        response = "".join(chunks)
+        if cancelled.is_set():
+            return response, False, ""
+        # A scanner only blocks what the check rejects, so this supplies the message
+        response_ok, response_not_ok_response = check(response)
+        return response, response_ok and not scanner.blocked, response_not_ok_response
+
+    def _get_options(self, candidate: int) -> dict:
+        temperatures = self.config.temperatures
+        return {
+            "temperature": temperatures[candidate % len(temperatures)],
+            "seed": random.getrandbits(31),
+        }
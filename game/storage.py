@@ -0,0 +1,158 @@
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+
+
+class KeyValueStore(ABC):
+    """Defines a bounded string key/value store with time based expiry."""
+
+    @abstractmethod
+    def get(self, key: str) -> str | None:
+        """Return the value for key and refresh its expiry, or None if it expired."""
+
+    @abstractmethod
+    def set(self, key: str, value: str) -> None:
+        """Store value under key and refresh its expiry."""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Remove key from the store if present."""
+
+
+class MemoryStore(KeyValueStore):
+    """In-process LRU store, local to a single worker."""
+
+    def __init__(self, max_size: int = 10000, ttl: float = 3600.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            now = time.monotonic()
+            if expires < now:
+                del self._items[key]
+                return None
+            self._items[key] = (now + self.ttl, value)
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._items.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class SQLiteStore(KeyValueStore):
+    """SQLite backed store that can be shared between worker processes on one host.
+
+    Reads refresh a key's expiry, so the keys that expire first are also the
+    least recently used. Expired and surplus keys are evicted every
+    evict_interval writes rather than on each one, so the store can briefly
+    hold a few more than max_size keys.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        max_size: int = 100000,
+        ttl: float = 3600.0,
+        evict_interval: int = 100,
+    ):
+        self.path = str(path)
+        self.max_size = max_size
+        self.ttl = ttl
+        self.evict_interval = evict_interval
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS store ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS store_expires ON store (expires)"
+            )
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._connection() as connection:
+            row = connection.execute(
+                "SELECT value FROM store WHERE key = ? AND expires >= ?", (key, now)
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                "UPDATE store SET expires = ? WHERE key = ?", (now + self.ttl, key)
+            )
+        return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO store (key, value, expires) VALUES (?, ?, ?)",
+                (key, value, now + self.ttl),
+            )
+            if self._count_write() % self.evict_interval == 0:
+                self._evict(connection, now)
+
+    def delete(self, key: str) -> None:
+        with self._connection() as connection:
+            connection.execute("DELETE FROM store WHERE key = ?", (key,))
+
+    def _count_write(self) -> int:
+        with self._writes_lock:
+            self._writes += 1
+            return self._writes
+
+    def _evict(self, connection: sqlite3.Connection, now: float):
+        connection.execute("DELETE FROM store WHERE expires < ?", (now,))
+        (size,) = connection.execute("SELECT COUNT(*) FROM store").fetchone()
+        if size > self.max_size:
+            connection.execute(
+                "DELETE FROM store WHERE key IN (SELECT key FROM store "
+                "ORDER BY expires LIMIT ?)",
+                (size - self.max_size,),
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return a connection for the current thread, sqlite connections can't be shared."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5.0)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+
+def create_store(
+    spec: str, max_size: int = 10000, ttl: float = 3600.0
+) -> KeyValueStore:
+    """Create a store from a spec string, either 'memory' or 'sqlite:///path/to/db'."""
+    if spec == "memory":
+        return MemoryStore(max_size=max_size, ttl=ttl)
+    if spec.startswith("sqlite:///"):
+        return SQLiteStore(spec.removeprefix("sqlite:///"), max_size=max_size, ttl=ttl)
+    raise ValueError(
+        f"Unsupported store: {spec}. Valid options are: memory, sqlite:///<path>"
+    )
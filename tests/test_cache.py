@@ -0,0 +1,41 @@
+from game.cache import CachedModelInterface
+from game.models import InstrumentedModelInterface, ModelInterface
+from game.storage import MemoryStore
+
+
+class FakeModel(ModelInterface):
+    def __init__(self, backend: str, model: str):
+        self.backend = backend
+        self.model = model
+        self.queries = 0
+
+    def query(self, query, system=None, options=None, history=None) -> str:
+        self.queries += 1
+        return f"{self.backend} {self.model}"
+
+    def get_info(self) -> dict:
+        return {"backend": self.backend, "model": self.model}
+
+
+def cached(model: FakeModel, store: MemoryStore) -> CachedModelInterface:
+    return CachedModelInterface(InstrumentedModelInterface(model, "test"), store)
+
+
+def test_backends_and_models_do_not_share_entries():
+    store = MemoryStore()
+    models = [
+        FakeModel("ollama", "llama3"),
+        FakeModel("ollama", "mistral"),
+        FakeModel("chatgpt", "llama3"),
+    ]
+    for model in models:
+        assert cached(model, store).query("Password?") == model.query("")
+
+
+def test_repeated_query_is_answered_from_cache():
+    store = MemoryStore()
+    model = FakeModel("ollama", "llama3")
+    cached(model, store).query("Password?", system="Level 0")
+    cached(model, store).query("Password?", system="Level 0")
+
+    assert model.queries == 1
@@ -0,0 +1,157 @@
+import time
+
+import pytest
+import requests
+from urllib3.exceptions import ReadTimeoutError
+
+from game.client import CircuitBreaker, ClientConfig, HTTPClient, ModelError
+
+URL = "http://backend:11434/api/chat"
+
+
+class FakeSession:
+    """Answers posts with the given status codes in turn, None for a connection error."""
+
+    def __init__(self, statuses: list[int | None]):
+        self.statuses = list(statuses)
+        self.posts = 0
+
+    def post(self, url, **kwargs) -> requests.Response:
+        self.posts += 1
+        status = self.statuses.pop(0)
+        if status is None:
+            raise requests.ConnectionError("Connection refused")
+        response = requests.Response()
+        response.status_code = status
+        response.headers["Retry-After"] = "0"
+        response._content = b""
+        response._content_consumed = True
+        return response
+
+
+class StalledBody:
+    """Response body of a backend that sends headers and then stops answering."""
+
+    def stream(self, chunk_size, decode_content=True):
+        raise ReadTimeoutError(None, None, "Read timed out.")
+
+    def close(self):
+        pass
+
+
+class StalledSession(FakeSession):
+    def post(self, url, **kwargs) -> requests.Response:
+        response = super().post(url, **kwargs)
+        response._content = False
+        response._content_consumed = False
+        response.raw = StalledBody()
+        return response
+
+
+def make_client(statuses: list[int | None], **config) -> HTTPClient:
+    config = {
+        "max_retries": 1,
+        "retry_backoff": 0.0,
+        "breaker_failures": 2,
+        "breaker_reset": 0.05,
+        **config,
+    }
+    client = HTTPClient(ClientConfig(**config))
+    client._session = FakeSession(statuses)
+    return client
+
+
+def open_circuit(client: HTTPClient):
+    for _ in range(client.config.breaker_failures):
+        assert client.post(URL).status_code == 503
+    assert client._breaker.is_open
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("backend", failure_threshold=2, reset_timeout=60.0)
+    breaker.record_failure()
+    breaker.check()
+    breaker.record_failure()
+
+    assert breaker.is_open
+    with pytest.raises(ModelError):
+        breaker.check()
+
+
+def test_success_resets_failures():
+    breaker = CircuitBreaker("backend", failure_threshold=2, reset_timeout=60.0)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+
+    assert not breaker.is_open
+
+
+def test_open_circuit_refuses_requests_without_posting():
+    client = make_client([503, 503, 503, 503])
+    open_circuit(client)
+    posts = client._session.posts
+
+    with pytest.raises(ModelError):
+        client.post(URL)
+    assert client._session.posts == posts
+
+
+def test_trial_retries_past_a_transient_failure_and_closes_circuit():
+    client = make_client([503, 503, 503, 503, 503, 200])
+    open_circuit(client)
+    time.sleep(client.config.breaker_reset)
+
+    # The trial's first attempt fails, its retry must not be refused by the breaker
+    assert client.post(URL).status_code == 200
+    assert not client._breaker.is_open
+    assert client._breaker.failures == 0
+
+
+def test_failed_trial_opens_circuit_again():
+    client = make_client([503, 503, 503, 503, 503, 503])
+    open_circuit(client)
+    time.sleep(client.config.breaker_reset)
+
+    assert client.post(URL).status_code == 503
+    assert client._breaker.is_open
+    with pytest.raises(ModelError):
+        client.post(URL)
+
+
+def test_final_connection_error_is_recorded():
+    client = make_client([None, None])
+
+    with pytest.raises(ModelError):
+        client.post(URL)
+    assert client._breaker.failures == 1
+
+
+def test_stream_checks_breaker_once_per_request():
+    client = make_client([503, 503, 503, 503, 503, 200])
+    open_circuit(client)
+    time.sleep(client.config.breaker_reset)
+
+    with client.stream(URL) as response:
+        assert response.status_code == 200
+    assert not client._breaker.is_open
+
+
+def test_rate_limited_trial_closes_circuit():
+    client = make_client([503, 503, 503, 503, 429, 429])
+    open_circuit(client)
+    time.sleep(client.config.breaker_reset)
+
+    assert client.post(URL).status_code == 429
+    assert not client._breaker.is_open
+
+
+def test_stream_timeout_mid_body_raises_model_error():
+    client = make_client([])
+    client._session = StalledSession([200])
+
+    with pytest.raises(ModelError):
+        with client.stream(URL) as response:
+            assert response.status_code == 200
+            list(response.iter_lines())
+    assert client._breaker.failures == 1
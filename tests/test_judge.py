@@ -0,0 +1,51 @@
+import threading
+
+from game.judge import JudgeConfig, ResponseJudge
+from game.models import ModelInterface
+
+PASSWORD = "GROCKTOPUS"
+
+
+class StalledModel(ModelInterface):
+    """Answers judge queries only once released."""
+
+    def __init__(self):
+        self.released = threading.Event()
+        self.queries = 0
+
+    def query(self, query, system=None, options=None, history=None) -> str:
+        self.queries += 1
+        self.released.wait(5)
+        return "NO"
+
+    def get_info(self) -> dict:
+        return {"model": "stalled"}
+
+
+def make_judge(**config) -> tuple[ResponseJudge, StalledModel]:
+    model = StalledModel()
+    config = {"latency_budget": 0.05, "fallback": "block", **config}
+    return ResponseJudge(model, JudgeConfig(**config)), model
+
+
+def test_timeout_uses_fallback_and_cancels_verdict():
+    judge, model = make_judge()
+    pending = judge.submit(PASSWORD, "Nothing to see here.")
+
+    assert judge.leaks(pending)
+    model.released.set()
+    assert pending.cancelled() or pending.result(timeout=5) is False
+
+
+def test_full_judge_allows_responses_unjudged():
+    judge, model = make_judge(max_pending=1)
+    first = judge.submit(PASSWORD, "First response.")
+    second = judge.submit(PASSWORD, "Second response.")
+
+    assert second.done() and second.result() is False
+    model.released.set()
+    assert first.result(timeout=5) is False
+    # The finished call frees its place for the next response
+    third = judge.submit(PASSWORD, "Third response.")
+    assert third.result(timeout=5) is False
+    assert model.queries == 2
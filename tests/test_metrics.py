@@ -0,0 +1,29 @@
+from game.metrics import MetricsRegistry
+
+
+def make_worker(directory) -> MetricsRegistry:
+    registry = MetricsRegistry()
+    registry.counter("queries_total", "Queries.").inc(level=1)
+    registry.histogram("latency_seconds", "Latency.", (1, 10)).observe(0.5)
+    registry.share(directory)
+    return registry
+
+
+def test_shared_metrics_add_up_all_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr("os.getpid", lambda: 1)
+    first = make_worker(tmp_path)
+    monkeypatch.setattr("os.getpid", lambda: 2)
+    second = make_worker(tmp_path)
+
+    for registry in (first, second):
+        lines = registry.render().splitlines()
+        assert 'queries_total{level="1"} 2' in lines
+        assert 'latency_seconds_bucket{le="1"} 2' in lines
+        assert "latency_seconds_count 2" in lines
+
+
+def test_unshared_metrics_are_the_workers_own():
+    registry = MetricsRegistry()
+    registry.counter("queries_total", "Queries.").inc(3)
+
+    assert "queries_total 3" in registry.render().splitlines()
@@ -0,0 +1,74 @@
+import time
+
+import pytest
+
+from game.client import ModelError
+from game.models import ModelInterface
+from game.routing import RoutingConfig, RoutingModelInterface
+
+
+class FakeBackend(ModelInterface):
+    """Answers with its name, or raises the given error."""
+
+    def __init__(self, name: str, error: Exception | None = None):
+        self.name = name
+        self.error = error
+        self.health_checks = 0
+
+    def query(self, query, system=None, options=None, history=None) -> str:
+        if self.error is not None:
+            raise self.error
+        return self.name
+
+    def get_info(self) -> dict:
+        return {"host": self.name}
+
+
+class MalformedHealthBackend(FakeBackend):
+    """Fails its first health check like a backend with an unexpected answer."""
+
+    def is_healthy(self) -> bool:
+        self.health_checks += 1
+        if self.health_checks == 1:
+            raise KeyError("models")
+        return True
+
+
+def make_router(*backends: ModelInterface, interval: float = 60.0):
+    return RoutingModelInterface(
+        list(backends), RoutingConfig(health_check_interval=interval)
+    )
+
+
+def test_rate_limited_backend_fails_over_and_stays_healthy():
+    limited = FakeBackend("a", ModelError("Too many requests", status_code=429))
+    router = make_router(limited, FakeBackend("b"))
+
+    assert router.query("hi") == "b"
+    assert all(backend.healthy for backend in router._backends)
+
+
+def test_failed_backend_fails_over_and_is_unhealthy():
+    router = make_router(FakeBackend("a", ModelError("Down")), FakeBackend("b"))
+
+    assert router.query("hi") == "b"
+    assert not router._backends[0].healthy
+
+
+def test_request_error_is_raised_at_once():
+    rejected = FakeBackend("a", ModelError("Bad request", status_code=400))
+    router = make_router(rejected, FakeBackend("b"))
+
+    with pytest.raises(ModelError):
+        router.query("hi")
+
+
+def test_health_check_survives_an_error():
+    backend = MalformedHealthBackend("a")
+    router = make_router(backend, interval=0.01)
+
+    deadline = time.monotonic() + 5
+    while backend.health_checks < 3:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert router._backends[0].healthy
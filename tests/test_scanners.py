@@ -0,0 +1,100 @@
+import pytest
+
+from game.leaks import LeakDetector, LeakScanner, fold
+from game.scanners import BufferedScanner, SubstringScanner
+
+PASSWORD = "STABLECONFUSION"
+
+
+def stream(scanner, chunks: list[str]) -> str:
+    shown = "".join(scanner.feed(chunk) for chunk in chunks)
+    return shown + scanner.flush()
+
+
+def test_substring_split_across_chunks_is_blocked():
+    scanner = SubstringScanner(PASSWORD)
+    shown = stream(scanner, ["The password is stab", "leconf", "usion, don't tell."])
+
+    assert scanner.blocked
+    assert "stab" not in shown.lower()
+
+
+def test_substring_holds_back_tail_until_flush():
+    scanner = SubstringScanner(PASSWORD)
+    text = "I can't tell you that, sorry."
+
+    assert scanner.feed(text) == text[: -(len(PASSWORD) - 1)]
+    assert scanner.flush() == text[-(len(PASSWORD) - 1) :]
+    assert not scanner.blocked
+
+
+def test_substring_blocks_after_partial_emit():
+    scanner = SubstringScanner(PASSWORD)
+    shown = scanner.feed("Here is a long harmless sentence before it. ")
+    shown += scanner.feed("The password is STABLE")
+    assert shown.startswith("Here is a long")
+
+    assert scanner.feed("CONFUSION, now you know.") == ""
+    assert scanner.blocked
+    assert scanner.feed("More text.") == ""
+    assert scanner.flush() == ""
+    assert "STABLE" not in shown
+
+
+def test_buffered_scanner_shows_nothing_before_flush():
+    scanner = BufferedScanner(SubstringScanner(PASSWORD))
+    text = ["A long and harmless ", "response, nothing to see."]
+
+    assert [scanner.feed(chunk) for chunk in text] == ["", ""]
+    assert scanner.flush() == "".join(text)
+
+
+def leak_scanner(batch_size: int) -> LeakScanner:
+    return LeakScanner(LeakDetector(PASSWORD), batch_size)
+
+
+@pytest.mark.parametrize("batch_size", [1, 8, 128])
+@pytest.mark.parametrize(
+    "chunks",
+    [
+        ["Sure! It is s-t-a-b", "-l-e-c-o-n", "-f-u-s-i-o-n."],
+        ["Backwards: NOISU", "FNOCEL", "BATS"],
+        ["In leetspeak: 57A8", "L3C0NFU", "510N"],
+        [
+            "Star\nTrue\nAlways\nBlue\nLove\n",
+            "Every\nCat\nOwl\nNight\n",
+            "Feel\nUnder\nSea\nIce\nOcean\nNow\n",
+        ],
+    ],
+)
+def test_leak_split_across_chunks_is_blocked(batch_size, chunks):
+    scanner = leak_scanner(batch_size)
+    shown = stream(scanner, chunks)
+
+    assert scanner.blocked
+    assert not LeakDetector(PASSWORD).contains_leak(shown)
+
+
+@pytest.mark.parametrize("batch_size", [1, 8, 128])
+def test_leak_scanner_holds_back_tail_until_flush(batch_size):
+    scanner = leak_scanner(batch_size)
+    chunks = ["I won't share ", "the password, ", "but I can tell you ", "a joke."]
+
+    shown = "".join(scanner.feed(chunk) for chunk in chunks)
+    held = scanner.flush()
+    assert shown + held == "".join(chunks)
+    # At least a password's worth of letters is held until the end
+    assert len(fold(held)) >= len(PASSWORD) - 1
+    assert not scanner.blocked
+
+
+def test_leak_scanner_blocks_after_partial_emit():
+    scanner = leak_scanner(1)
+    shown = scanner.feed("A long and harmless introduction comes first. ")
+    shown += scanner.feed("Now: S T A B L E C O N")
+    assert shown.startswith("A long")
+
+    assert scanner.feed(" F U S I O N") == ""
+    assert scanner.blocked
+    assert scanner.flush() == ""
+    assert "S T A B" not in shown
@@ -0,0 +1,102 @@
+import threading
+import time
+
+import pytest
+
+from game.scheduler import FairScheduler, ModelBusyError, SchedulerConfig
+
+
+def make_scheduler(**config) -> FairScheduler:
+    config = {"max_concurrent": 1, "queue_timeout": 5.0, **config}
+    return FairScheduler(SchedulerConfig(**config))
+
+
+def wait_for_queued(scheduler: FairScheduler, queued: int):
+    deadline = time.monotonic() + 5
+    while scheduler._queued < queued:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def queue(scheduler: FairScheduler, player: str, order: list[str]) -> threading.Thread:
+    """Wait for a slot in a thread, record the player when it gets one and free it."""
+
+    def run():
+        with scheduler.slot(player):
+            order.append(player)
+
+    queued = scheduler._queued + 1
+    thread = threading.Thread(target=run)
+    thread.start()
+    wait_for_queued(scheduler, queued)
+    return thread
+
+
+def test_free_slots_go_round_robin_between_players():
+    scheduler = make_scheduler(max_queued_per_player=3)
+    scheduler.acquire("holder")
+    order = []
+    threads = [queue(scheduler, player, order) for player in ["a", "a", "a", "b", "c"]]
+
+    scheduler.release()
+    for thread in threads:
+        thread.join(5)
+    assert order == ["a", "b", "c", "a", "a"]
+
+
+def test_full_queue_rejects_at_once():
+    scheduler = make_scheduler(max_queued=1)
+    scheduler.acquire("holder")
+    thread = queue(scheduler, "a", [])
+
+    with pytest.raises(ModelBusyError) as error:
+        scheduler.acquire("b")
+    assert error.value.retry_after > 0
+    scheduler.release()
+    thread.join(5)
+
+
+def test_full_player_queue_rejects_at_once():
+    scheduler = make_scheduler(max_queued_per_player=1)
+    scheduler.acquire("holder")
+    thread = queue(scheduler, "a", [])
+
+    with pytest.raises(ModelBusyError):
+        scheduler.acquire("a")
+    scheduler.release()
+    thread.join(5)
+
+
+def test_waiting_too_long_times_out():
+    scheduler = make_scheduler(queue_timeout=0.05)
+    scheduler.acquire("holder")
+
+    with pytest.raises(ModelBusyError):
+        scheduler.acquire("a")
+    assert scheduler._queued == 0
+
+
+def test_release_hands_slot_to_next_waiter():
+    scheduler = make_scheduler()
+    scheduler.acquire("holder")
+    order = []
+    thread = queue(scheduler, "a", order)
+
+    scheduler.release()
+    thread.join(5)
+    assert order == ["a"]
+    # The slot went straight to the waiter, so it was never free in between
+    assert scheduler._active == 0
+    assert scheduler.try_acquire()
+    assert not scheduler.try_acquire()
+
+
+def test_try_acquire_leaves_slots_to_waiting_players():
+    scheduler = make_scheduler(max_concurrent=2)
+    scheduler.acquire("holder")
+    assert scheduler.try_acquire()
+    thread = queue(scheduler, "a", [])
+
+    assert not scheduler.try_acquire()
+    scheduler.release()
+    thread.join(5)
@@ -0,0 +1,77 @@
+import multiprocessing
+import time
+
+import pytest
+
+from game.storage import MemoryStore, SQLiteStore, create_store
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    def make_store(**kwargs):
+        if request.param == "memory":
+            return MemoryStore(**kwargs)
+        # Evicting on every write makes the size limit exact
+        return SQLiteStore(tmp_path / "store.db", evict_interval=1, **kwargs)
+
+    return make_store
+
+
+def test_evicts_least_recently_used(make_store):
+    store = make_store(max_size=2)
+    store.set("a", "1")
+    time.sleep(0.01)
+    store.set("b", "2")
+    time.sleep(0.01)
+    # Reading a makes b the least recently used key
+    assert store.get("a") == "1"
+    time.sleep(0.01)
+    store.set("c", "3")
+
+    assert store.get("a") == "1"
+    assert store.get("b") is None
+    assert store.get("c") == "3"
+
+
+def test_expires_after_ttl(make_store):
+    store = make_store(ttl=0.05)
+    store.set("a", "1")
+    assert store.get("a") == "1"
+
+    time.sleep(0.1)
+    assert store.get("a") is None
+
+
+def test_read_refreshes_expiry(make_store):
+    store = make_store(ttl=0.1)
+    store.set("a", "1")
+    for _ in range(3):
+        time.sleep(0.05)
+        assert store.get("a") == "1"
+
+
+def test_delete(make_store):
+    store = make_store()
+    store.set("a", "1")
+    store.delete("a")
+
+    assert store.get("a") is None
+
+
+def _set_in_process(path: str, key: str, value: str):
+    create_store(f"sqlite:///{path}").set(key, value)
+
+
+def test_sqlite_store_is_shared_between_processes(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = create_store(f"sqlite:///{path}")
+    store.set("level", "0")
+
+    worker = multiprocessing.get_context("spawn").Process(
+        target=_set_in_process, args=(path, "level", "3")
+    )
+    worker.start()
+    worker.join(timeout=30)
+
+    assert worker.exitcode == 0
+    assert store.get("level") == "3"